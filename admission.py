@@ -0,0 +1,161 @@
+"""Admission control for api_server: a bounded wait queue in front of the pipeline and per-client token buckets.
+
+Requests beyond the concurrency limit wait in a queue of bounded length for at
+most ``max_queue_seconds``; anything that cannot be served in time is rejected
+immediately with a ``Retry-After`` hint instead of timing out 90 seconds later.
+"""
+
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(int(retry_after + 0.999), 1)
+
+
+class AdmissionQueue:
+    """At most ``max_concurrent`` holders; up to ``max_queued`` more wait FIFO for ``max_queue_seconds``."""
+
+    def __init__(self, max_concurrent: int, max_queued: int, max_queue_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_queue_seconds = max_queue_seconds
+        self.in_flight = 0
+        self._waiters = OrderedDict()
+        self._seq = 0
+        # Moving average of how long a slot is held, for Retry-After estimates.
+        self._hold_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        backlog = self.queued + self.in_flight - self.max_concurrent + 1
+        return max(backlog, 1) * self._hold_seconds / max(self.max_concurrent, 1)
+
+    async def acquire(self) -> "Slot":
+        """Wait for a slot or raise Rejected when the queue is full or the wait runs out."""
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            return Slot(self, 0.0)
+        if self.queued >= self.max_queued:
+            raise Rejected(503, "queue_full", self.retry_after())
+
+        started = time.perf_counter()
+        self._seq += 1
+        key = self._seq
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_queue_seconds)
+        except asyncio.TimeoutError:
+            # A slot handed over right as the wait expired is still ours to use.
+            if not waiter.done() or waiter.cancelled():
+                raise Rejected(503, "queue_timeout", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            self._waiters.pop(key, None)
+        return Slot(self, time.perf_counter() - started)
+
+    def _release(self, held: float = 0.0):
+        if held:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held
+        while self._waiters:
+            _, waiter = self._waiters.popitem(last=False)
+            if not waiter.done():
+                # The slot moves straight to the next waiter, so in_flight is unchanged.
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "queued": self.queued, "hold_seconds": round(self._hold_seconds, 3)}
+
+
+class Slot:
+    """A held admission slot; ``release`` is idempotent."""
+
+    def __init__(self, queue: AdmissionQueue, waited: float):
+        self.queue = queue
+        self.waited = waited
+        self.admitted = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.queue._release(time.perf_counter() - self.admitted)
+
+
+class RateLimiter:
+    """Token bucket per client key: ``rate`` requests per second with bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str, cost: float = 1.0):
+        """Spend ``cost`` tokens for ``key`` or raise Rejected(429)."""
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            raise Rejected(429, "rate_limited", (cost - tokens) / self.rate)
+
+    def stats(self) -> dict:
+        return {"clients": len(self._buckets)}
+
+
+def key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def client_key(headers, client_host: str, proxy_hops: int = 0, api_keys=frozenset()) -> str:
+    """The API key's digest when it is one of ``api_keys`` (digests), else the client IP.
+
+    Unknown keys are ignored; otherwise a client could rotate made-up keys to get a fresh bucket per request.
+    Behind ``proxy_hops`` trusted proxies the IP is the X-Forwarded-For entry the outermost one appended,
+    counted from the right: everything to its left was sent by the client and can be anything.
+    """
+    api_key = headers.get("x-api-key") or ""
+    auth = headers.get("authorization") or ""
+    if auth.lower().startswith("bearer "):
+        api_key = api_key or auth[7:].strip()
+    if api_key and api_keys:
+        digest = key_digest(api_key)
+        if digest in api_keys:
+            return "key:" + digest
+    forwarded = [hop.strip() for hop in (headers.get("x-forwarded-for") or "").split(",") if hop.strip()]
+    if proxy_hops > 0 and forwarded:
+        return "ip:" + forwarded[-min(proxy_hops, len(forwarded))]
+    return "ip:" + (client_host or "unknown")
+
+
+REJECTIONS = metrics.Counter(
+    "ora_admission_rejections_total", "Requests turned away by admission control.", ("endpoint", "reason")
+)
+QUEUE_WAIT = metrics.Histogram("ora_admission_queue_seconds", "Time admitted requests spent queued.", ("endpoint",))
@@ -1,31 +1,89 @@
 import asyncio
+import json
 import logging
+import os
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import List, Optional, Literal
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, field_validator
 
+import admission
+import capture
+import logs
+import metrics
+import sessions
 import step3_dataset_gpt_with_contract_and_strict_rag as rag
 
 
 MAX_QUERY_LENGTH = 500
+MAX_BATCH_SIZE = 1000
 MAX_HISTORY_TURNS = 6
 MAX_HISTORY_CONTENT_LENGTH = 500
 REQUEST_TIMEOUT_SECONDS = 90  # FIX 3: raised from 15 to give full pipeline time to complete
+# Upper bound on in-flight /ask pipelines per worker; they are awaited on the event loop, not threads.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("ORA_MAX_CONCURRENT_REQUESTS", "200"))
+# Requests beyond that wait in a bounded queue; past either limit they get a fast 503 with Retry-After.
+MAX_QUEUED_REQUESTS = int(os.getenv("ORA_MAX_QUEUED_REQUESTS", "400"))
+MAX_QUEUE_SECONDS = float(os.getenv("ORA_MAX_QUEUE_SECONDS", "5"))
+# Per-client token bucket, keyed by an allow-listed API key (ORA_API_KEYS) or else by client IP.
+RATE_LIMIT_ENABLED = os.getenv("ORA_RATE_LIMIT", "1") == "1"
+RATE_LIMIT_RPS = float(os.getenv("ORA_RATE_LIMIT_RPS", "5"))
+RATE_LIMIT_BURST = float(os.getenv("ORA_RATE_LIMIT_BURST", "20"))
+# Reverse proxies in front of the server that append to X-Forwarded-For; 0 ignores the header.
+TRUSTED_PROXY_HOPS = int(os.getenv("ORA_TRUSTED_PROXY_HOPS", "0"))
+# Comma-separated keys that get their own bucket; any other X-API-Key is limited by IP.
+API_KEYS = frozenset(admission.key_digest(k.strip()) for k in os.getenv("ORA_API_KEYS", "").split(",") if k.strip())
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Warm clients, connection pools and startup embeddings before /readyz reports ready.
+WARMUP_ENABLED = os.getenv("ORA_WARMUP", "1") == "1"
+WARMUP_RETRY_SECONDS = 10
 
 ALLOWED_ORIGINS = ["*"]
 
-executor = ThreadPoolExecutor(max_workers=10)
+admission_queue = admission.AdmissionQueue(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, MAX_QUEUE_SECONDS)
+rate_limiter = admission.RateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+background_tasks = set()
 
-logging.basicConfig(level=logging.INFO, format="[API %(levelname)s] %(message)s")
+logs.configure()
 log = logging.getLogger("api")
 
 
-app = FastAPI(title="ORA Backend")
+readiness = {"ready": not WARMUP_ENABLED, "warmup": {}}
+
+
+def warm(status: dict) -> bool:
+    retrieval_ok = status.get("pinecone") in ("ok", "skipped") or status.get("local_index") == "ok"
+    return status.get("openai") == "ok" and retrieval_ok
+
+
+async def warm_up():
+    while True:
+        status = await rag.awarm_up()
+        readiness["warmup"] = status
+        if warm(status):
+            readiness["ready"] = True
+            return
+        log.warning(f"warm-up incomplete, retrying in {WARMUP_RETRY_SECONDS}s: {status}")
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background so the server binds immediately; /readyz gates traffic.
+    capture.configure()
+    task = asyncio.create_task(warm_up()) if WARMUP_ENABLED else None
+    yield
+    if task is not None:
+        task.cancel()
+
+
+app = FastAPI(title="ORA Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -54,6 +112,17 @@ class HistoryTurn(BaseModel):
 class AskRequest(BaseModel):
     query: str
     history: Optional[List[HistoryTurn]] = None
+    # The server keeps the conversation under the session id it returns; send that id back on the
+    # next turn. ``history`` only seeds a new session.
+    session_id: Optional[str] = None
+
+    @field_validator("session_id")
+    @classmethod
+    def validate_session_id(cls, v: Optional[str]) -> Optional[str]:
+        v = (v or "").strip().lower()
+        if v and not sessions.valid_id(v):
+            raise ValueError("Invalid session id")
+        return v or None
 
     @field_validator("query")
     @classmethod
@@ -72,6 +141,34 @@ class AskResponse(BaseModel):
     source: str
     request_id: str
     latency_ms: float
+    session_id: Optional[str] = None
+    routing: Optional[dict] = None
+    debug: Optional[dict] = None
+
+
+class BatchAskRequest(BaseModel):
+    queries: List[str]
+
+    @field_validator("queries")
+    @classmethod
+    def validate_queries(cls, v: List[str]) -> List[str]:
+        if not v:
+            raise ValueError("Empty batch")
+        if len(v) > MAX_BATCH_SIZE:
+            raise ValueError("Batch too large")
+        return [(q or "").strip() for q in v]
+
+
+class BatchAnswer(BaseModel):
+    answer: str
+    references: List[str]
+    source: str
+
+
+class BatchAskResponse(BaseModel):
+    results: List[BatchAnswer]
+    request_id: str
+    latency_ms: float
 
 
 def normalize_history(history: List[HistoryTurn] | None) -> List[dict]:
@@ -81,64 +178,349 @@ def normalize_history(history: List[HistoryTurn] | None) -> List[dict]:
     return [{"role": item.role, "content": item.content} for item in trimmed]
 
 
-async def run_generate_answer(query: str, history: List[dict]) -> dict:
-    loop = asyncio.get_running_loop()
-    return await asyncio.wait_for(
-        loop.run_in_executor(executor, rag.generate_answer, query, history),
-        timeout=REQUEST_TIMEOUT_SECONDS,
+async def request_history(req: AskRequest) -> List[dict]:
+    """Prompt history; binds ``req.session_id`` to a stored session or to a freshly minted id."""
+    session = await sessions.aload(req.session_id) if req.session_id else None
+    if session is None:
+        # Missing, expired or unknown ids start a new session under an id only the server chose.
+        req.session_id = sessions.new_id()
+        return normalize_history(req.history)
+    return sessions.history(session)
+
+
+async def remember_turn(req: AskRequest, answer: str):
+    """Append the exchange to the session and schedule compaction when it has grown long."""
+    session = await sessions.aload_or_create(req.session_id, normalize_history(req.history))
+    sessions.append(session, req.query, answer)
+    await sessions.asave(req.session_id, session)
+    if sessions.compactable(session):
+        task = asyncio.create_task(rag.acompact_session(req.session_id))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def admit(endpoint: str, request: Request, cost: float = 1) -> admission.Slot:
+    """Charge the client's rate limit, then wait for a pipeline slot; raises admission.Rejected."""
+    try:
+        if RATE_LIMIT_ENABLED:
+            client = request.client.host if request.client else ""
+            rate_limiter.check(admission.client_key(request.headers, client, TRUSTED_PROXY_HOPS, API_KEYS), cost)
+        slot = await admission_queue.acquire()
+    except admission.Rejected as e:
+        admission.REJECTIONS.inc(endpoint=endpoint, reason=e.reason)
+        raise
+    admission.QUEUE_WAIT.observe(slot.waited, endpoint=endpoint)
+    return slot
+
+
+def rejection(request_id: str, error: admission.Rejected) -> JSONResponse:
+    log.warning("rejected", extra={"reason": error.reason, "retry_after": error.retry_after})
+    return JSONResponse(
+        {"detail": "Too many requests." if error.status_code == 429 else "Server busy.", "reason": error.reason,
+         "request_id": request_id},
+        status_code=error.status_code,
+        headers={"Retry-After": str(error.retry_after)},
     )
 
 
-@app.post("/ask", response_model=AskResponse)
-async def ask(req: AskRequest, request: Request):
+async def run_cancellable(coro, request: Request, timeout: Optional[float] = None):
+    """Await ``coro`` as a task that is cancelled on timeout or as soon as the client disconnects."""
+    task = asyncio.create_task(coro)
+    disconnected = False
+
+    async def watch():
+        nonlocal disconnected
+        while not task.done():
+            if await request.is_disconnected():
+                disconnected = True
+                task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        return await asyncio.wait_for(task, timeout=None if timeout is None else max(timeout, 0))
+    except asyncio.CancelledError:
+        if disconnected:
+            raise ClientDisconnected()
+        raise
+    finally:
+        watcher.cancel()
+
+
+async def run_generate_answer(query: str, history: List[dict], request: Request, started: float) -> dict:
+    timeout = REQUEST_TIMEOUT_SECONDS - (time.perf_counter() - started)
+    return await run_cancellable(rag.agenerate_answer(query, history), request, timeout)
+
+
+def observe_request(endpoint: str, source: str, started: float) -> float:
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+    metrics.REQUESTS.inc(endpoint=endpoint, source=source)
+    if source == "timeout":
+        metrics.TIMEOUTS.inc(endpoint=endpoint)
+    return round(elapsed * 1000, 2)
+
+
+@app.post("/ask", response_model=AskResponse, response_model_exclude_none=True)
+async def ask(req: AskRequest, request: Request, debug: bool = False):
     request_id = str(uuid.uuid4())
+    logs.set_request_id(request_id)
     started = time.perf_counter()
+    trace = metrics.start_trace()
+
+    try:
+        slot = await admit("ask", request)
+    except admission.Rejected as e:
+        return rejection(request_id, e)
 
     try:
         query = req.query
-        history = normalize_history(req.history)
+        history = await request_history(req)
 
-        log.info(f"[{request_id}] /ask query={query[:120]!r} history_turns={len(history)}")
+        log.info("/ask", extra={"query": query[:120], "history_turns": len(history), "session_id": req.session_id})
 
-        result = await run_generate_answer(query, history)
+        result = await run_generate_answer(query, history, request, started)
 
-        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        source = result.get("source", "unknown")
+        await remember_turn(req, result.get("answer", ""))
+        latency_ms = observe_request("ask", source, started)
 
-        log.info(
-            f"[{request_id}] completed source={result.get('source', 'unknown')} latency_ms={latency_ms}"
-        )
+        log.info("completed", extra={"source": source, "latency_ms": latency_ms, "stages_ms": trace["stages_ms"]})
+        capture.record("ask", query, normalize_history(req.history), result, trace)
 
         return AskResponse(
             answer=result.get("answer", ""),
             references=result.get("refs", []),
-            source=result.get("source", "unknown"),
+            source=source,
             request_id=request_id,
             latency_ms=latency_ms,
+            session_id=req.session_id,
+            routing=result.get("routing"),
+            debug=trace if debug else None,
         )
 
+    except ClientDisconnected:
+        latency_ms = observe_request("ask", "client_disconnected", started)
+        log.info("client disconnected, pipeline cancelled", extra={"latency_ms": latency_ms})
+        # Nobody is listening; 499 only shows up in access logs.
+        return Response(status_code=499)
+
     except asyncio.TimeoutError:
-        latency_ms = round((time.perf_counter() - started) * 1000, 2)
-        log.error(f"[{request_id}] timeout latency_ms={latency_ms}")
+        latency_ms = observe_request("ask", "timeout", started)
+        log.error("timeout", extra={"latency_ms": latency_ms, "stages_ms": trace["stages_ms"]})
         return AskResponse(
             answer="Request timed out.",
             references=[],
             source="timeout",
             request_id=request_id,
             latency_ms=latency_ms,
+            debug=trace if debug else None,
         )
 
     except Exception:
-        latency_ms = round((time.perf_counter() - started) * 1000, 2)
-        log.exception(f"[{request_id}] server_error latency_ms={latency_ms}")
+        latency_ms = observe_request("ask", "server_error", started)
+        log.exception("server_error", extra={"latency_ms": latency_ms})
         return AskResponse(
             answer="Server error.",
             references=[],
             source="server_error",
             request_id=request_id,
             latency_ms=latency_ms,
+            debug=trace if debug else None,
         )
 
+    finally:
+        slot.release()
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Holds the admission slot until the stream is finished, however it ends."""
+
+    def __init__(self, content, slot: admission.Slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+async def stream_answer_events(req: AskRequest, request: Request, history: List[dict], request_id: str, started: float):
+    trace = metrics.start_trace()
+    deadline = started + REQUEST_TIMEOUT_SECONDS
+    events = rag.astream_answer(req.query, history)
+    source = "unknown"
+    routing = None
+    parts = []
+    error_answer = None
+    meta_sent = False
+
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(anext(events), timeout=max(deadline - time.perf_counter(), 0))
+            except StopAsyncIteration:
+                break
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+
+            if event["event"] == "meta":
+                meta_sent = True
+                yield sse("meta", {"refs": event["refs"], "request_id": request_id})
+            elif event["event"] == "token":
+                parts.append(event["text"])
+                yield sse("token", {"text": event["text"]})
+            elif event["event"] == "done":
+                source = event["source"]
+                routing = event.get("routing")
+
+    except (ClientDisconnected, asyncio.CancelledError) as e:
+        # Starlette cancels the generator when it notices the disconnect first. Either way the
+        # finally below closes ``events``, which cancels the answer stream and its upstream calls.
+        latency_ms = observe_request("ask_stream", "client_disconnected", started)
+        log.info("client disconnected, stream cancelled", extra={"latency_ms": latency_ms})
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return
+
+    except asyncio.TimeoutError:
+        log.error("stream timeout")
+        source, error_answer = "timeout", "Request timed out."
+
+    except Exception:
+        log.exception("stream server_error")
+        source, error_answer = "server_error", "Server error."
+
+    finally:
+        await events.aclose()
+
+    if error_answer is not None:
+        if not meta_sent:
+            yield sse("meta", {"refs": [], "request_id": request_id})
+        yield sse("token", {"text": error_answer})
+    else:
+        answer = "".join(parts).strip()
+        await remember_turn(req, answer)
+        capture.record("ask_stream", req.query, normalize_history(req.history), {"answer": answer, "source": source}, trace)
+
+    latency_ms = observe_request("ask_stream", source, started)
+    log.info("stream completed", extra={"source": source, "latency_ms": latency_ms, "stages_ms": trace["stages_ms"]})
+    done = {"source": source, "latency_ms": latency_ms}
+    done["session_id"] = req.session_id
+    if routing is not None:
+        done["routing"] = routing
+    yield sse("done", done)
+
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest, request: Request):
+    request_id = str(uuid.uuid4())
+    logs.set_request_id(request_id)
+    started = time.perf_counter()
+    # Loaded before admission so a failing session lookup cannot leave a slot held.
+    history = await request_history(req)
+
+    try:
+        slot = await admit("ask_stream", request)
+    except admission.Rejected as e:
+        return rejection(request_id, e)
+
+    log.info("/ask/stream", extra={"query": req.query[:120], "history_turns": len(history), "session_id": req.session_id})
+
+    return AdmittedStreamingResponse(
+        stream_answer_events(req, request, history, request_id, started),
+        slot,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask/batch", response_model=BatchAskResponse)
+async def ask_batch(req: BatchAskRequest, request: Request):
+    request_id = str(uuid.uuid4())
+    logs.set_request_id(request_id)
+    started = time.perf_counter()
+
+    log.info("/ask/batch", extra={"size": len(req.queries)})
+
+    valid = [i for i, q in enumerate(req.queries) if q and len(q) <= MAX_QUERY_LENGTH]
+    # A batch is charged per query against the rate limit (capped at the burst) but holds one slot.
+    try:
+        slot = await admit("ask_batch", request, cost=max(len(valid), 1))
+    except admission.Rejected as e:
+        return rejection(request_id, e)
+    try:
+        answers = await run_cancellable(
+            rag.agenerate_answers([req.queries[i] for i in valid], item_timeout=REQUEST_TIMEOUT_SECONDS), request
+        )
+    except ClientDisconnected:
+        latency_ms = observe_request("ask_batch", "client_disconnected", started)
+        log.info("client disconnected, batch cancelled", extra={"size": len(valid), "latency_ms": latency_ms})
+        return Response(status_code=499)
+    finally:
+        slot.release()
+
+    results = [BatchAnswer(answer="Invalid query.", references=[], source="invalid_query") for _ in req.queries]
+    for i, result in zip(valid, answers):
+        results[i] = BatchAnswer(
+            answer=result.get("answer", ""),
+            references=result.get("refs", []),
+            source=result.get("source", "unknown"),
+        )
+
+    for result in results:
+        metrics.REQUESTS.inc(endpoint="ask_batch", source=result.source)
+        if result.source == "timeout":
+            metrics.TIMEOUTS.inc(endpoint="ask_batch")
+    latency_ms = round((time.perf_counter() - started) * 1000, 2)
+    metrics.REQUEST_LATENCY.observe(latency_ms / 1000, endpoint="ask_batch")
+    log.info("batch completed", extra={"size": len(results), "latency_ms": latency_ms})
+
+    return BatchAskResponse(results=results, request_id=request_id, latency_ms=latency_ms)
+
+
+@metrics.collector
+def admission_metrics():
+    st = admission_queue.stats()
+    return [
+        (
+            "ora_admission_requests",
+            "Admitted pipelines in flight and requests waiting for a slot.",
+            "gauge",
+            [({"state": "in_flight"}, st["in_flight"]), ({"state": "queued"}, st["queued"])],
+        ),
+        ("ora_rate_limit_clients", "Clients with a live token bucket.", "gauge", [({}, rate_limiter.stats()["clients"])]),
+    ]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 def root():
     return {"status": "ok", "service": "ORA backend"}
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    if not readiness["ready"]:
+        return JSONResponse({"status": "warming_up", "warmup": readiness["warmup"]}, status_code=503)
+    return {"status": "ready", "warmup": readiness["warmup"]}
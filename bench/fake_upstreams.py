@@ -0,0 +1,243 @@
+"""Local stand-ins for the OpenAI and Pinecone APIs used by the RAG module.
+
+Serves ``/v1/chat/completions`` (including ``stream=True``), ``/v1/embeddings``
+and the Pinecone data-plane ``/query``, ``/vectors/upsert`` and ``/vectors/delete`` from one process, each with canned
+responses and configurable latency/jitter, so ``api_server`` can be load-tested
+without spending money or hitting rate limits:
+
+    python -m bench.fake_upstreams --port 9100 --chat-latency-ms 800 --jitter 0.3
+    ORA_UPSTREAM_BASE_URL=http://127.0.0.1:9100 OPENAI_API_KEY=fake PINECONE_API_KEY=fake ORA_RATE_LIMIT=0 \\
+        uvicorn api_server:app --port 8000
+
+``ORA_RATE_LIMIT=0`` turns off the per-client rate limit (5 rps, burst 20 by default);
+otherwise a load driver sending from one address mostly measures 429s.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+EMBED_DIM = 3072
+
+LATENCY_MS = {
+    "chat": float(os.getenv("FAKE_CHAT_LATENCY_MS", "600")),
+    "chat_fast": float(os.getenv("FAKE_FAST_CHAT_LATENCY_MS", "250")),
+    "embed": float(os.getenv("FAKE_EMBED_LATENCY_MS", "120")),
+    "query": float(os.getenv("FAKE_QUERY_LATENCY_MS", "60")),
+}
+JITTER = float(os.getenv("FAKE_JITTER", "0.2"))  # +/- fraction of the base latency
+TOKEN_DELAY_MS = float(os.getenv("FAKE_TOKEN_DELAY_MS", "15"))
+
+CANNED_ANSWER = (
+    "Tooth pain is usually caused by decay, nerve inflammation, or gum inflammation. "
+    "If it continues or gets worse, a dental checkup is recommended."
+)
+CANNED_CHUNKS = [
+    {"title": "Toothache", "chunk_text": "Toothache is commonly caused by dental caries, pulpitis or gingival inflammation."},
+    {"title": "Extraction aftercare", "chunk_text": "After extraction bite on gauze for 30 minutes and avoid rinsing for 24 hours."},
+    {"title": "Gum disease", "chunk_text": "Bleeding gums are an early sign of gingivitis caused by plaque accumulation."},
+    {"title": "Wisdom teeth", "chunk_text": "Wisdom teeth are removed when they cause pain, infection or lack space."},
+    {"title": "Sensitivity", "chunk_text": "Sensitivity to hot and cold may indicate exposed dentin or nerve involvement."},
+    {"title": "Whitening", "chunk_text": "Sensitivity after whitening is common during the first few days."},
+    {"title": "Children", "chunk_text": "Decay in primary teeth may need fillings, pulp therapy or a space maintainer."},
+    {"title": "Swelling", "chunk_text": "Facial swelling with pain may need antibiotics and incision and drainage."},
+]
+
+app = FastAPI(title="ORA fake upstreams")
+stats = {"chat": 0, "chat_stream": 0, "embed": 0, "embed_inputs": 0, "query": 0, "upserted": 0, "deleted": 0}
+
+
+async def delay(kind: str):
+    base = LATENCY_MS[kind]
+    await asyncio.sleep(max(base * (1 + random.uniform(-JITTER, JITTER)), 0) / 1000)
+
+
+def usage(prompt: str, completion: str = "") -> dict:
+    prompt_tokens = max(len(prompt) // 4, 1)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(completion) // 4,
+        "total_tokens": prompt_tokens + len(completion) // 4,
+        "prompt_tokens_details": {"cached_tokens": (prompt_tokens // 1024) * 1024},
+    }
+
+
+def reply_for(messages) -> str:
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+    if "relevance checker" in system:
+        return "yes"
+    if system.startswith("Translate"):
+        return "my tooth hurts"
+    if system.startswith("Clean the query"):
+        return user
+    return CANNED_ANSWER
+
+
+def fake_vector(text: str) -> list:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    content = reply_for(messages)
+    prompt = "".join(m.get("content", "") for m in messages)
+    kind = "chat" if body.get("model") == "gpt-4o" else "chat_fast"
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        stats["chat"] += 1
+        await delay(kind)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage(prompt, content),
+        }
+
+    stats["chat_stream"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(delta: dict, finish=None, chunk_usage=None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        if chunk_usage:
+            data["usage"] = chunk_usage
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        # Time to first token is modelled as a third of the full completion latency.
+        await asyncio.sleep(LATENCY_MS[kind] / 3000)
+        yield chunk({"role": "assistant", "content": ""})
+        for word in content.split(" "):
+            await asyncio.sleep(TOKEN_DELAY_MS / 1000)
+            yield chunk({"content": word + " "})
+        yield chunk({}, finish="stop")
+        if include_usage:
+            yield chunk({}, chunk_usage=usage(prompt, content))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    inputs = inputs if isinstance(inputs, list) else [inputs]
+    stats["embed"] += 1
+    stats["embed_inputs"] += len(inputs)
+    await delay("embed")
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": fake_vector(str(t))} for i, t in enumerate(inputs)],
+        "model": body.get("model"),
+        "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in inputs), "total_tokens": sum(len(str(t)) // 4 for t in inputs)},
+    }
+
+
+@app.post("/query")
+async def query(request: Request):
+    body = await request.json()
+    top_k = int(body.get("topK") or body.get("top_k") or 8)
+    stats["query"] += 1
+    await delay("query")
+    matches = [
+        {"id": f"chunk-{i}", "score": round(0.9 - i * 0.03, 4), "metadata": dict(md)}
+        for i, md in enumerate(CANNED_CHUNKS[:top_k])
+    ]
+    return {"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 5}}
+
+
+@app.post("/vectors/upsert")
+async def upsert(request: Request):
+    body = await request.json()
+    stats["upserted"] += len(body.get("vectors", []))
+    await delay("query")
+    return {"upsertedCount": len(body.get("vectors", []))}
+
+
+@app.post("/vectors/delete")
+async def delete(request: Request):
+    body = await request.json()
+    stats["deleted"] += len(body.get("ids", []))
+    return {}
+
+
+@app.post("/describe_index_stats")
+async def describe_index_stats():
+    return {
+        "namespaces": {"": {"vectorCount": len(CANNED_CHUNKS)}},
+        "dimension": EMBED_DIM,
+        "totalVectorCount": len(CANNED_CHUNKS),
+    }
+
+
+@app.get("/indexes/{name}")
+async def describe_index(name: str, request: Request):
+    return {
+        "name": name,
+        "dimension": EMBED_DIM,
+        "metric": "cosine",
+        "host": str(request.base_url).rstrip("/"),
+        "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+        "status": {"ready": True, "state": "Ready"},
+        "vector_type": "dense",
+        "deletion_protection": "disabled",
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+def main():
+    global JITTER
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--chat-latency-ms", type=float, default=LATENCY_MS["chat"])
+    parser.add_argument("--fast-chat-latency-ms", type=float, default=LATENCY_MS["chat_fast"])
+    parser.add_argument("--embed-latency-ms", type=float, default=LATENCY_MS["embed"])
+    parser.add_argument("--query-latency-ms", type=float, default=LATENCY_MS["query"])
+    parser.add_argument("--jitter", type=float, default=JITTER)
+    args = parser.parse_args()
+
+    LATENCY_MS.update(
+        chat=args.chat_latency_ms,
+        chat_fast=args.fast_chat_latency_ms,
+        embed=args.embed_latency_ms,
+        query=args.query_latency_ms,
+    )
+    JITTER = args.jitter
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
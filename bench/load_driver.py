@@ -0,0 +1,132 @@
+"""Replay a JSONL query log against ``/ask`` at a target request rate.
+
+Each line needs a ``query`` (or ``title``) field; ``history`` is forwarded when
+present, so files captured with ``ORA_CAPTURE_PATH`` replay as they are. Requests are sent open-loop, so a slow server shows up as latency and
+timeouts rather than a lower send rate:
+
+    python -m bench.load_driver queries.jsonl --url http://127.0.0.1:8000 --rps 50 --duration 60
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+
+import httpx
+
+
+def load_queries(path: str):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            query = row.get("query") or row.get("title")
+            if query:
+                items.append({"query": query, "history": row.get("history") or None})
+    return items
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[k]
+
+
+def summarize(results, elapsed: float) -> dict:
+    latencies = [r["latency_ms"] for r in results if r["ok"]]
+    stages = defaultdict(list)
+    for r in results:
+        for name, ms in (r.get("stages_ms") or {}).items():
+            stages[name].append(ms)
+
+    return {
+        "requests": len(results),
+        "ok": len(latencies),
+        "errors": sum(1 for r in results if not r["ok"]),
+        "timeouts": sum(1 for r in results if r.get("source") == "timeout"),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+        "sources": dict(Counter(r.get("source", "error") for r in results)),
+        "models": dict(Counter(r["model"] for r in results if r.get("model"))),
+        "stages_ms": {
+            name: {"p50": round(percentile(v, 50), 1), "p95": round(percentile(v, 95), 1), "n": len(v)}
+            for name, v in sorted(stages.items())
+        },
+    }
+
+
+async def send(http: httpx.AsyncClient, url: str, item: dict, timeout: float) -> dict:
+    started = time.perf_counter()
+    payload = {"query": item["query"]}
+    if item["history"]:
+        payload["history"] = item["history"]
+    try:
+        r = await http.post(f"{url}/ask", params={"debug": "true"}, json=payload, timeout=timeout)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if r.status_code != 200:
+            return {"ok": False, "latency_ms": latency_ms, "source": f"http_{r.status_code}"}
+        body = r.json()
+        return {
+            "ok": True,
+            "latency_ms": latency_ms,
+            "source": body.get("source"),
+            "stages_ms": (body.get("debug") or {}).get("stages_ms"),
+            "model": (body.get("routing") or {}).get("model"),
+        }
+    except httpx.TimeoutException:
+        return {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "source": "client_timeout"}
+    except httpx.HTTPError as e:
+        return {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "source": type(e).__name__}
+
+
+async def run(url: str, items, rps: float, duration: float, total: int, timeout: float, concurrency: int) -> dict:
+    total = total or int(rps * duration)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    tasks = []
+    started = time.perf_counter()
+
+    async with httpx.AsyncClient(limits=limits) as http:
+        for i in range(total):
+            target = started + i / rps
+            wait = target - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            tasks.append(asyncio.create_task(send(http, url, items[i % len(items)], timeout)))
+        results = await asyncio.gather(*tasks)
+
+    return summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSONL file of queries to replay")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds; ignored when --requests is set")
+    parser.add_argument("--requests", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--concurrency", type=int, default=1000, help="max open client connections")
+    args = parser.parse_args()
+
+    items = load_queries(args.log)
+    if not items:
+        sys.exit(f"no queries found in {args.log}")
+
+    report = asyncio.run(run(args.url, items, args.rps, args.duration, args.requests, args.timeout, args.concurrency))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+log = logging.getLogger("ora")
+
+CACHE_DB_PATH = os.getenv("ORA_CACHE_DB", "")  # empty keeps every cache in-process only
+CACHE_TTL_SECONDS = float(os.getenv("ORA_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+TEXT_CACHE_MAX_ENTRIES = int(os.getenv("ORA_TEXT_CACHE_MAX_ENTRIES", "20000"))
+EMBED_CACHE_MAX_BYTES = int(os.getenv("ORA_EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("ORA_DISK_CACHE_MAX_ENTRIES", "200000"))
+# The disk cache counts and trims a namespace once per this many writes, not on every set.
+DISK_EVICT_INTERVAL = 500
+# Semantic-cache partitions start this small and double as they fill, up to their max_entries.
+INITIAL_PARTITION_CAPACITY = 64
+
+
+def as_vector(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float32)
+
+
+def value_size(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return len(str(value).encode("utf-8"))
+
+
+def encode_value(value):
+    if isinstance(value, np.ndarray):
+        return "v", value.astype(np.float32).tobytes()
+    return "s", str(value).encode("utf-8")
+
+
+def decode_value(kind: str, blob: bytes):
+    if kind == "v":
+        return np.frombuffer(blob, dtype=np.float32).copy()
+    return blob.decode("utf-8")
+
+
+class LRUCache:
+    """In-process LRU with an entry limit, an optional byte limit and a TTL."""
+
+    def __init__(self, max_entries: int = TEXT_CACHE_MAX_ENTRIES, max_bytes: int = 0, ttl: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count: bool = True):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and item[1] < time.time():
+                self._pop(key)
+                item = None
+            if item is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        size = value_size(value)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, time.time() + self.ttl if self.ttl else 0, size)
+            self.bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes)
+            ):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """On-disk cache shared by every worker on the host; survives restarts."""
+
+    def __init__(self, path: str, namespace: str, max_entries: int = DISK_CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "ns TEXT NOT NULL, key TEXT NOT NULL, kind TEXT NOT NULL, value BLOB NOT NULL, "
+            "expires REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (ns, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (ns, accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, value, expires FROM cache WHERE ns = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] and row[2] < now:
+                self._conn.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed = ? WHERE ns = ? AND key = ?", (now, self.namespace, key)
+            )
+        return decode_value(row[0], row[1])
+
+    def set(self, key, value):
+        now = time.time()
+        kind, blob = encode_value(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (ns, key, kind, value, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, kind, blob, now + self.ttl if self.ttl else 0, now),
+            )
+            self._writes += 1
+            if self._writes % DISK_EVICT_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        """Trim the namespace back to ``max_entries``, least recently accessed first; caller holds the lock."""
+        count = self._conn.execute("SELECT COUNT(*) FROM cache WHERE ns = ?", (self.namespace,)).fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE ns = ? AND key IN "
+                "(SELECT key FROM cache WHERE ns = ? ORDER BY accessed LIMIT ?)",
+                (self.namespace, self.namespace, count - self.max_entries),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE ns = ?", (self.namespace,))
+
+
+class TieredCache:
+    """LRU in front of an optional SQLite store; disk hits are promoted into memory."""
+
+    def __init__(self, namespace: str, memory: LRUCache, path: str = CACHE_DB_PATH, ttl: float = CACHE_TTL_SECONDS):
+        self.namespace = namespace
+        self.memory = memory
+        self.disk = None
+        if path:
+            try:
+                self.disk = SQLiteCache(path, namespace, ttl=ttl)
+            except Exception as e:
+                log.warning(f"cache {namespace}: disk backend disabled: {e}")
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        try:
+            value = self.disk.get(key)
+        except Exception as e:
+            log.warning(f"cache {self.namespace}: disk get failed: {e}")
+            return None
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                log.warning(f"cache {self.namespace}: disk set failed: {e}")
+
+    async def aget(self, key):
+        """``get`` for the event loop: a memory miss reads the disk store in a worker thread."""
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        try:
+            value = await asyncio.to_thread(self.disk.get, key)
+        except Exception as e:
+            log.warning(f"cache {self.namespace}: disk get failed: {e}")
+            return None
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    async def aset(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except Exception as e:
+                log.warning(f"cache {self.namespace}: disk set failed: {e}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        return {**self.memory.stats(), "disk": self.disk is not None}
+
+
+def text_cache(namespace: str) -> TieredCache:
+    return TieredCache(namespace, LRUCache(max_entries=TEXT_CACHE_MAX_ENTRIES))
+
+
+def vector_cache(namespace: str) -> TieredCache:
+    return TieredCache(namespace, LRUCache(max_entries=DISK_CACHE_MAX_ENTRIES, max_bytes=EMBED_CACHE_MAX_BYTES))
+
+
+class SemanticCache:
+    """Nearest-neighbour answer cache over normalized query embeddings, one partition per language."""
+
+    def __init__(self, threshold: float, max_entries: int = 5000, ttl: float = CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, key: str, dim: int) -> dict:
+        part = self._partitions.get(key)
+        if part is None or part["vectors"].shape[1] != dim:
+            capacity = min(INITIAL_PARTITION_CAPACITY, self.max_entries)
+            part = {
+                "vectors": np.zeros((capacity, dim), dtype=np.float32),
+                "expires": np.zeros(capacity, dtype=np.float64),
+                "values": [None] * capacity,
+                "size": 0,
+                "next": 0,
+            }
+            self._partitions[key] = part
+        return part
+
+    def _grow(self, part: dict):
+        """Double a full partition, up to ``max_entries``; only then does it start overwriting the oldest."""
+        capacity = len(part["values"])
+        if part["size"] < capacity or capacity >= self.max_entries:
+            return
+        new_capacity = min(capacity * 2, self.max_entries)
+        vectors = np.zeros((new_capacity, part["vectors"].shape[1]), dtype=np.float32)
+        vectors[:capacity] = part["vectors"]
+        expires = np.zeros(new_capacity, dtype=np.float64)
+        expires[:capacity] = part["expires"]
+        part["vectors"], part["expires"] = vectors, expires
+        part["values"].extend([None] * (new_capacity - capacity))
+        part["next"] = capacity
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = as_vector(vector)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def lookup(self, partition: str, vector):
+        """Return (value, similarity) for the closest live entry above threshold, else (None, best)."""
+        v = self._unit(vector)
+        with self._lock:
+            part = self._partitions.get(partition)
+            if part is None or not part["size"] or part["vectors"].shape[1] != v.shape[0]:
+                self.misses += 1
+                return None, 0.0
+            n = part["size"]
+            sims = part["vectors"][:n] @ v
+            if self.ttl:
+                sims[part["expires"][:n] < time.time()] = -1.0
+            best = int(np.argmax(sims))
+            score = float(sims[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None, score
+            self.hits += 1
+            return part["values"][best], score
+
+    def add(self, partition: str, vector, value):
+        v = self._unit(vector)
+        with self._lock:
+            part = self._partition(partition, v.shape[0])
+            self._grow(part)
+            slot = part["next"]
+            part["vectors"][slot] = v
+            part["expires"][slot] = time.time() + self.ttl if self.ttl else np.inf
+            part["values"][slot] = value
+            part["next"] = (slot + 1) % self.max_entries
+            part["size"] = min(part["size"] + 1, self.max_entries)
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": sum(p["size"] for p in self._partitions.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
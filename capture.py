@@ -0,0 +1,79 @@
+"""Sampled capture of answered requests as replayable JSONL.
+
+With ``ORA_CAPTURE_PATH`` set, a ``ORA_CAPTURE_SAMPLE_RATE`` fraction of
+answered requests is written one JSON object per line. Each line has the
+``query`` (and ``history``) fields that ``bench/load_driver.py`` replays, plus
+the rewritten query, retrieved chunk ids, answer, source and stage timings.
+``history`` is the request's own field, not the server-side session: session
+history can hold a summary turn and long answers that ``/ask`` would reject.
+Lines go through the same kind of queue as the logs, to a size-rotated file.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import logging.handlers
+
+import logs
+
+CAPTURE_PATH = os.getenv("ORA_CAPTURE_PATH", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("ORA_CAPTURE_SAMPLE_RATE", "0.01"))
+CAPTURE_MAX_BYTES = int(os.getenv("ORA_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+CAPTURE_BACKUPS = int(os.getenv("ORA_CAPTURE_BACKUPS", "5"))
+
+_logger = logging.getLogger("ora.capture")
+_logger.propagate = False
+_configured = False
+_stats = {"captured": 0}
+
+
+class CaptureFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.capture, ensure_ascii=False, default=str)
+
+
+def configure():
+    global _configured
+    if _configured or not CAPTURE_PATH:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(CAPTURE_PATH)), exist_ok=True)
+    out = logging.handlers.RotatingFileHandler(
+        CAPTURE_PATH, maxBytes=CAPTURE_MAX_BYTES, backupCount=CAPTURE_BACKUPS, encoding="utf-8"
+    )
+    out.setFormatter(CaptureFormatter())
+    logs.start_listener(_logger, out)
+    _configured = True
+
+
+def sampled() -> bool:
+    return _configured and random.random() < CAPTURE_SAMPLE_RATE
+
+
+def record(endpoint: str, query: str, history, result: dict, trace: dict):
+    """Capture one answered request if it is sampled.
+
+    ``history`` is the history the client sent; ``trace`` is the request's ``metrics.start_trace()``.
+    """
+    if not sampled():
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "request_id": logs.request_id(),
+        "endpoint": endpoint,
+        "query": query,
+        "rewritten_query": trace.get("rewritten_query"),
+        "chunk_ids": trace.get("chunk_ids", []),
+        "answer": result.get("answer", ""),
+        "source": result.get("source", "unknown"),
+        "stages_ms": dict(trace["stages_ms"]),
+    }
+    if history:
+        entry["history"] = history
+    _logger.info("capture", extra={"capture": entry})
+    _stats["captured"] += 1
+
+
+def stats() -> dict:
+    return {**_stats, "enabled": _configured, "sample_rate": CAPTURE_SAMPLE_RATE}
@@ -0,0 +1,149 @@
+"""Context packing: trim the retrieved chunks to what the answer prompt actually needs.
+
+Chunks arrive in relevance order. Near-duplicates (MinHash over word shingles)
+are dropped, neighbouring chunks of the same document are merged with their
+overlap removed, and the result fills a token budget in relevance order.
+"""
+
+import os
+import re
+import zlib
+from functools import reduce
+
+import numpy as np
+
+PACKING_ENABLED = os.getenv("ORA_CONTEXT_PACKING", "1") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ORA_CONTEXT_TOKEN_BUDGET", "1500"))
+# Estimated Jaccard similarity of word shingles at which a chunk counts as a repeat.
+DUPLICATE_THRESHOLD = float(os.getenv("ORA_CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+# Longest run of words checked when stitching two neighbouring chunks (ingest overlaps by 40).
+MAX_OVERLAP_WORDS = 80
+MIN_OVERLAP_WORDS = 5
+
+WORD_RE = re.compile(r"\w+")
+# Ids written by ingest.py, "doc#3": the document and the chunk's position in it. Other ids (including
+# the synthetic "match-{i}", which is a rank, not a position) are never treated as neighbours.
+POSITION_RE = re.compile(r"^(.+)#(\d+)$")
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(7)
+_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def estimate_tokens(text: str) -> int:
+    # Same 4-chars-per-token estimate the answer path uses.
+    return len(text) // 4
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS):
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) & _PRIME for s in shingles(text)), dtype=np.uint64
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def drop_duplicates(chunks, threshold: float = DUPLICATE_THRESHOLD):
+    """Keep the first (most relevant) of every group of near-identical chunks."""
+    kept, signatures = [], []
+    for c in chunks:
+        sig = minhash(c["text"])
+        if any(similarity(sig, other) >= threshold for other in signatures):
+            continue
+        kept.append(c)
+        signatures.append(sig)
+    return kept
+
+
+def chunk_position(chunk):
+    m = POSITION_RE.match(str(chunk["id"]))
+    return (m.group(1), int(m.group(2))) if m else None
+
+
+def join_overlapping(a: str, b: str) -> str:
+    """Concatenate two consecutive chunks, dropping the words ``b`` repeats from the end of ``a``."""
+    wa, wb = a.split(), b.split()
+    for k in range(min(len(wa), len(wb), MAX_OVERLAP_WORDS), MIN_OVERLAP_WORDS - 1, -1):
+        if wa[-k:] == wb[:k]:
+            return " ".join(wa + wb[k:])
+    return f"{a}\n{b}"
+
+
+def merge_adjacent(chunks):
+    """Merge runs of consecutive chunks of one document into a single chunk at the best-ranked position."""
+    groups = {}
+    for pos, c in enumerate(chunks):
+        position = chunk_position(c)
+        if position is not None:
+            groups.setdefault((position[0], c["title"]), []).append((position[1], pos))
+
+    merged, absorbed = {}, set()
+    for members in groups.values():
+        members.sort()
+        runs = [[members[0]]]
+        for index, pos in members[1:]:
+            if index == runs[-1][-1][0] + 1:
+                runs[-1].append((index, pos))
+            else:
+                runs.append([(index, pos)])
+        for run in runs:
+            if len(run) < 2:
+                continue
+            best = min(pos for _, pos in run)
+            text = reduce(join_overlapping, [chunks[pos]["text"] for _, pos in run])
+            merged[best] = {**chunks[best], "text": text, "merged_ids": [chunks[pos]["id"] for _, pos in run]}
+            absorbed.update(pos for _, pos in run if pos != best)
+
+    return [merged.get(pos, c) for pos, c in enumerate(chunks) if pos not in absorbed]
+
+
+def truncate(text: str, budget: int) -> str:
+    return text[:budget * 4].rsplit(" ", 1)[0]
+
+
+def fill_budget(chunks, budget: int = CONTEXT_TOKEN_BUDGET):
+    """Take chunks in order while they fit; the best chunk is truncated rather than dropped."""
+    packed, used = [], 0
+    for c in chunks:
+        tokens = estimate_tokens(c["text"])
+        if used + tokens <= budget:
+            packed.append(c)
+            used += tokens
+        elif not packed:
+            packed.append({**c, "text": truncate(c["text"], budget)})
+            used = budget
+    return packed
+
+
+def pack(chunks, budget: int = CONTEXT_TOKEN_BUDGET):
+    """Return (packed chunks, report) for chunks given in relevance order."""
+    unique = drop_duplicates(chunks)
+    merged = merge_adjacent(unique)
+    packed = fill_budget(merged, budget)
+
+    tokens_in = sum(estimate_tokens(c["text"]) for c in chunks)
+    tokens_out = sum(estimate_tokens(c["text"]) for c in packed)
+    report = {
+        "chunks_in": len(chunks),
+        "chunks_out": len(packed),
+        "duplicates": len(chunks) - len(unique),
+        "merged": len(unique) - len(merged),
+        "over_budget": len(merged) - len(packed),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": tokens_in - tokens_out,
+    }
+    return packed, report
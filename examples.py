@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import threading
+
+import numpy as np
+
+from cache import as_vector
+
+EXAMPLES_PATH = os.getenv("ORA_EXAMPLES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples.json"))
+
+LANGS = ("english", "arabic")
+
+ARABIC_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u0640]")
+PUNCT_RE = re.compile(r"[^\w\s]")
+SPACE_RE = re.compile(r"\s+")
+
+ARABIC_LETTER_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+    "ئ": "ي",
+})
+
+
+def normalize_text(text: str) -> str:
+    text = (text or "").strip().lower()
+    text = ARABIC_DIACRITICS_RE.sub("", text)
+    text = text.translate(ARABIC_LETTER_MAP)
+    text = PUNCT_RE.sub(" ", text)
+    return SPACE_RE.sub(" ", text).strip()
+
+
+def load_examples(path: str = EXAMPLES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def render_examples(examples) -> str:
+    blocks = []
+    for ex in examples:
+        for lang in LANGS:
+            blocks.append(f"{ex[lang]['question']}\n{ex[lang]['answer']}")
+    return "\n\n".join(blocks)
+
+
+class ExampleMatcher:
+    """Maps a user question onto a curated example by normalized text or embedding similarity."""
+
+    def __init__(self, examples, threshold: float):
+        self.examples = examples
+        self.threshold = threshold
+        self.vectors = None
+        self._lock = threading.Lock()
+        self._by_text = {}
+        for i, ex in enumerate(examples):
+            for lang in LANGS:
+                self._by_text[normalize_text(ex[lang]["question"])] = i
+
+    def questions(self):
+        return [ex["english"]["question"] for ex in self.examples]
+
+    def set_vectors(self, vectors):
+        m = np.vstack([as_vector(v) for v in vectors])
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        with self._lock:
+            self.vectors = m / norms
+
+    def answer(self, i: int, lang: str) -> str:
+        return self.examples[i][lang]["answer"]
+
+    def match_text(self, q: str):
+        return self._by_text.get(normalize_text(q))
+
+    def match_vector(self, vector):
+        """Return (index, similarity) of the closest example question, or (None, best)."""
+        if self.vectors is None or vector is None:
+            return None, 0.0
+        v = as_vector(vector)
+        norm = float(np.linalg.norm(v))
+        if not norm:
+            return None, 0.0
+        sims = self.vectors @ (v / norm)
+        best = int(np.argmax(sims))
+        score = float(sims[best])
+        if score < self.threshold:
+            return None, score
+        return best, score
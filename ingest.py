@@ -0,0 +1,251 @@
+"""Build or refresh the Pinecone corpus from a directory of source documents.
+
+Documents (``.txt``/``.md``, or ``.jsonl`` rows with ``title`` and ``text``) are
+split into chunks with stable ids. Each chunk's content hash is kept in a
+manifest, so a refresh only embeds chunks that are new or changed and deletes
+the ones that disappeared. Embedding requests and Pinecone upserts both run in
+large batches across a worker pool:
+
+    python ingest.py docs/ --snapshot snapshot/
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+log = logging.getLogger("ora")
+
+DOC_EXTENSIONS = (".txt", ".md", ".jsonl")
+CHUNK_MAX_WORDS = int(os.getenv("ORA_INGEST_CHUNK_WORDS", "220"))
+CHUNK_OVERLAP_WORDS = 40
+EMBED_BATCH_SIZE = 256
+# 3072-dim vectors with metadata; keeps each upsert request under Pinecone's 2 MB limit.
+UPSERT_BATCH_SIZE = 40
+DELETE_BATCH_SIZE = 1000
+MANIFEST_FILE = ".ingest_manifest.json"
+
+HEADING_RE = re.compile(r"^#+\s*(.+)$", re.MULTILINE)
+SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+def slug(text: str) -> str:
+    return SLUG_RE.sub("-", text.lower()).strip("-") or "doc"
+
+
+def content_hash(title: str, text: str) -> str:
+    return hashlib.sha256(f"{title}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def read_documents(root: str):
+    """Yield (doc_id, title, text) for every supported file under ``root``, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.endswith(DOC_EXTENSIONS) or name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            with open(path, encoding="utf-8") as f:
+                if name.endswith(".jsonl"):
+                    for i, line in enumerate(f):
+                        if not line.strip():
+                            continue
+                        row = json.loads(line)
+                        doc_id = str(row.get("id") or f"{slug(rel)}-{i}")
+                        yield doc_id, str(row.get("title") or ""), str(row.get("text") or "")
+                    continue
+                text = f.read()
+            heading = HEADING_RE.search(text)
+            title = heading.group(1).strip() if heading else os.path.splitext(name)[0].replace("_", " ")
+            yield slug(os.path.splitext(rel)[0]), title, text
+
+
+def split_words(words, max_words: int = CHUNK_MAX_WORDS, overlap: int = CHUNK_OVERLAP_WORDS):
+    step = max(max_words - overlap, 1)
+    return [" ".join(words[i:i + max_words]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+def chunk_text(text: str, max_words: int = CHUNK_MAX_WORDS):
+    """Pack whole paragraphs up to ``max_words``; only paragraphs longer than that are split mid-way."""
+    chunks, current = [], []
+    for para in re.split(r"\n\s*\n", text):
+        words = para.split()
+        if not words:
+            continue
+        if len(words) > max_words:
+            if current:
+                chunks.append(" ".join(current))
+                current = []
+            chunks.extend(split_words(words, max_words))
+            continue
+        if len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def build_chunks(root: str, chunk_field: str, title_field: str):
+    """Return {chunk_id: {"hash", "metadata"}} for the whole corpus."""
+    chunks = {}
+    for doc_id, title, text in read_documents(root):
+        for i, piece in enumerate(chunk_text(text)):
+            chunk_id = f"{doc_id}#{i}"
+            if chunk_id in chunks:
+                raise ValueError(f"duplicate chunk id {chunk_id}")
+            h = content_hash(title, piece)
+            chunks[chunk_id] = {
+                "hash": h,
+                "metadata": {chunk_field: piece, title_field: title, "source": doc_id, "content_hash": h},
+            }
+    return chunks
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def batches(items, size: int):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def embed_texts(client, model: str, texts, batch_size: int, workers: int):
+    """Embed ``texts`` in batches of ``batch_size`` across ``workers`` threads; returns a float32 matrix."""
+
+    def embed_batch(batch):
+        r = client.embeddings.create(model=model, input=batch)
+        return [item.embedding for item in r.data]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(embed_batch, batches(list(texts), batch_size)))
+    return np.asarray([v for batch in results for v in batch], dtype=np.float32)
+
+
+def upsert(index, ids, vectors, metadata, workers: int, namespace: str = ""):
+    rows = [{"id": i, "values": v.tolist(), "metadata": md} for i, v, md in zip(ids, vectors, metadata)]
+
+    def upsert_batch(batch):
+        index.upsert(vectors=batch, namespace=namespace, show_progress=False)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(upsert_batch, batches(rows, UPSERT_BATCH_SIZE)))
+
+
+def previous_vectors(snapshot_path: str, chunks: dict) -> dict:
+    """Vectors of an earlier snapshot whose stored content hash matches the chunk as it is now.
+
+    The check is against the snapshot row itself, not the manifest: a snapshot written with
+    ``--no-upsert`` can be ahead of (or behind) what Pinecone and the manifest hold.
+    """
+    from local_index import load_local_index
+
+    local = load_local_index(snapshot_path)
+    if local is None:
+        return {}
+    return {
+        vid: local.vectors[i]
+        for i, vid in enumerate(local.ids)
+        if vid in chunks and local.metadata[i].get("content_hash") == chunks[vid]["hash"]
+    }
+
+
+def ingest(root: str, rag, snapshot: str = "", manifest_path: str = "", workers: int = 4,
+           batch_size: int = EMBED_BATCH_SIZE, upload: bool = True, prune: bool = True, dry_run: bool = False) -> dict:
+    started = time.perf_counter()
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+    chunks = build_chunks(root, rag.PINECONE_CHUNK_FIELD, rag.PINECONE_TITLE_FIELD)
+
+    changed = [cid for cid, c in chunks.items() if manifest.get(cid) != c["hash"]]
+    removed = [cid for cid in manifest if cid not in chunks]
+    report = {"chunks": len(chunks), "changed": len(changed), "removed": len(removed), "embedded": 0}
+    if dry_run:
+        return report
+
+    vectors = previous_vectors(snapshot, chunks) if snapshot else {}
+    # A snapshot holds every chunk, so any chunk without a reusable vector is embedded.
+    to_embed = [cid for cid in chunks if cid not in vectors] if snapshot else list(changed)
+
+    if to_embed:
+        texts = [chunks[cid]["metadata"][rag.PINECONE_CHUNK_FIELD] for cid in to_embed]
+        embedded = embed_texts(rag.get_client(), rag.EMBED_MODEL, texts, batch_size, workers)
+        vectors.update(zip(to_embed, embedded))
+        report["embedded"] = len(to_embed)
+        log.info(f"ingest embedded={len(to_embed)} batches={-(-len(to_embed) // batch_size)}")
+
+    if upload:
+        if changed:
+            metadata = [chunks[cid]["metadata"] for cid in changed]
+            upsert(rag.get_index(), changed, [vectors[cid] for cid in changed], metadata, workers)
+        if prune and removed:
+            for batch in batches(removed, DELETE_BATCH_SIZE):
+                rag.get_index().delete(ids=batch)
+        if prune:
+            manifest = {}
+        manifest.update((cid, c["hash"]) for cid, c in chunks.items())
+        save_manifest(manifest_path, manifest)
+
+    if snapshot:
+        from local_index import write_snapshot
+
+        ids = list(chunks)
+        write_snapshot(snapshot, ids, [vectors[cid] for cid in ids], [chunks[cid]["metadata"] for cid in ids])
+        report["snapshot"] = snapshot
+
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("docs", help="directory of .txt/.md/.jsonl source documents")
+    parser.add_argument("--snapshot", default="", help="also write a local index snapshot to this directory")
+    parser.add_argument("--manifest", default="", help=f"content-hash manifest (default: <docs>/{MANIFEST_FILE})")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="inputs per embeddings request")
+    parser.add_argument("--no-upsert", action="store_true", help="skip Pinecone; only write the snapshot")
+    parser.add_argument("--keep-removed", action="store_true", help="do not delete chunks whose source is gone")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.docs):
+        sys.exit(f"not a directory: {args.docs}")
+
+    import step3_dataset_gpt_with_contract_and_strict_rag as rag
+
+    report = ingest(
+        args.docs,
+        rag,
+        snapshot=args.snapshot,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        upload=not args.no_upsert,
+        prune=not args.keep_removed,
+        dry_run=args.dry_run,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""BM25 over the corpus chunks, rank fusion with dense matches, and a local reranker."""
+
+import os
+import re
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+HYBRID_ENABLED = os.getenv("ORA_HYBRID_RETRIEVAL", "1") == "1"
+RRF_K = 60
+RERANK_TOP_N = int(os.getenv("ORA_RERANK_TOP_N", "5"))
+RERANK_MIN_SCORE = float(os.getenv("ORA_RERANK_MIN_SCORE", "0.15"))
+
+# Weights of the reranker's features; missing features are left out of the normalization.
+DENSE_WEIGHT = 0.6
+LEXICAL_WEIGHT = 0.3
+PHRASE_WEIGHT = 0.1
+# text-embedding-3-large cosine similarities for on-topic chunks mostly fall in this band.
+DENSE_FLOOR = 0.2
+DENSE_CEIL = 0.7
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = set("""
+a an and are as at be but by can do does for from had has have how i if in into is it its my of on or our
+should so than that the their them then there these they this to was what when where which while who why
+will with would you your me we he she his her not no
+""".split())
+
+
+def tokenize(text: str):
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def bigrams(tokens):
+    return {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+class BM25Index:
+    def __init__(self, ids, texts, k1: float = 1.5, b: float = 0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.lengths[i] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((i, tf))
+        self.avg_length = float(self.lengths.mean()) if len(self.ids) else 0.0
+        n = len(self.ids)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int):
+        """Return [(doc_position, score)] for the best ``top_k`` documents."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda kv: -kv[1])[:top_k]
+
+
+def rrf_fuse(*rankings):
+    """Reciprocal rank fusion of id lists; returns ids ordered by fused score."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+    return sorted(fused, key=lambda d: -fused[d])
+
+
+def rerank(query: str, candidates):
+    """Score candidates ({text, dense, bm25}) locally, drop those under the cutoff, keep the best few.
+
+    Adds a ``rerank`` score in [0, 1] to each returned candidate.
+    """
+    if not candidates:
+        return []
+
+    q_tokens = tokenize(query)
+    q_bigrams = bigrams(q_tokens)
+    q_terms = set(q_tokens)
+    max_bm25 = max((c.get("bm25") or 0.0) for c in candidates)
+
+    for c in candidates:
+        features = []
+        if c.get("dense") is not None:
+            dense = (c["dense"] - DENSE_FLOOR) / (DENSE_CEIL - DENSE_FLOOR)
+            features.append((DENSE_WEIGHT, min(max(dense, 0.0), 1.0)))
+        if max_bm25 > 0:
+            features.append((LEXICAL_WEIGHT, (c.get("bm25") or 0.0) / max_bm25))
+        if q_terms:
+            c_tokens = tokenize(c["text"])
+            # Exact multi-word terms ("space maintainer") count most; single-term coverage otherwise.
+            if q_bigrams:
+                phrase = len(q_bigrams & bigrams(c_tokens)) / len(q_bigrams)
+            else:
+                phrase = len(q_terms & set(c_tokens)) / len(q_terms)
+            features.append((PHRASE_WEIGHT, phrase))
+
+        total = sum(w for w, _ in features)
+        c["rerank"] = sum(w * v for w, v in features) / total if total else 0.0
+
+    ranked = sorted(candidates, key=lambda c: -c["rerank"])
+    return [c for c in ranked if c["rerank"] >= RERANK_MIN_SCORE][:RERANK_TOP_N]
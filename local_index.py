@@ -0,0 +1,142 @@
+"""In-process vector index over the corpus chunks, loaded from a memory-mapped snapshot.
+
+A snapshot directory holds ``vectors.npy`` (unit-normalized float32, one row per
+chunk) and ``meta.jsonl`` (``id`` plus the Pinecone metadata for each row). Build
+one from the live index with:
+
+    python local_index.py export snapshot/
+"""
+
+import os
+import sys
+import json
+import logging
+
+import numpy as np
+
+log = logging.getLogger("ora")
+
+try:
+    import hnswlib
+except ImportError:  # optional: exact NumPy search is used without it
+    hnswlib = None
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.jsonl"
+
+USE_HNSW = os.getenv("ORA_LOCAL_INDEX_HNSW", "0") == "1"
+HNSW_EF = 64
+HNSW_M = 16
+
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+def write_snapshot(path: str, ids, vectors, metadata):
+    os.makedirs(path, exist_ok=True)
+    m = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    tmp = os.path.join(path, VECTORS_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, m)
+    os.replace(tmp, os.path.join(path, VECTORS_FILE))
+
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for vid, md in zip(ids, metadata):
+            f.write(json.dumps({"id": vid, "metadata": md or {}}, ensure_ascii=False) + "\n")
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+class LocalIndex:
+    """Cosine top-k over a snapshot; returns Pinecone-shaped match dicts."""
+
+    def __init__(self, path: str, use_hnsw: bool = USE_HNSW):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.ids = []
+        self.metadata = []
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                self.ids.append(row["id"])
+                self.metadata.append(row.get("metadata") or {})
+
+        if len(self.ids) != self.vectors.shape[0]:
+            raise ValueError(f"snapshot {path}: {len(self.ids)} ids for {self.vectors.shape[0]} vectors")
+
+        self.hnsw = None
+        if use_hnsw and hnswlib is not None and len(self.ids):
+            self.hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+            self.hnsw.init_index(max_elements=len(self.ids), ef_construction=200, M=HNSW_M)
+            self.hnsw.add_items(np.asarray(self.vectors), np.arange(len(self.ids)))
+            self.hnsw.set_ef(HNSW_EF)
+
+        log.info(f"local index loaded path={path} vectors={len(self.ids)} hnsw={self.hnsw is not None}")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, vector, top_k: int):
+        if not len(self.ids):
+            return []
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        if norm:
+            v = v / norm
+        k = min(top_k, len(self.ids))
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(v, k=k)
+            order, scores = labels[0], 1.0 - distances[0]
+        else:
+            sims = self.vectors @ v
+            top = np.argpartition(-sims, k - 1)[:k]
+            order = top[np.argsort(-sims[top])]
+            scores = sims[order]
+
+        return [
+            {"id": self.ids[i], "score": float(s), "metadata": self.metadata[i]}
+            for i, s in zip(order, scores)
+        ]
+
+
+def load_local_index(path: str):
+    """Return a LocalIndex for ``path``, or None when there is no usable snapshot."""
+    if not path or not os.path.exists(os.path.join(path, VECTORS_FILE)):
+        return None
+    try:
+        return LocalIndex(path)
+    except Exception as e:
+        log.warning(f"local index unavailable path={path}: {e}")
+        return None
+
+
+def export_from_pinecone(index, path: str, namespace: str = "", batch_size: int = 100) -> int:
+    ids, vectors, metadata = [], [], []
+    for page in index.list(namespace=namespace):
+        page_ids = [getattr(item, "id", item) for item in page]
+        for i in range(0, len(page_ids), batch_size):
+            fetched = index.fetch(ids=page_ids[i:i + batch_size], namespace=namespace).vectors
+            for vid, vec in fetched.items():
+                ids.append(vid)
+                vectors.append(vec.values)
+                metadata.append(dict(vec.metadata or {}))
+    write_snapshot(path, ids, vectors, metadata)
+    return len(ids)
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != "export":
+        sys.exit("usage: python local_index.py export <snapshot_dir>")
+
+    import step3_dataset_gpt_with_contract_and_strict_rag as rag
+
+    count = export_from_pinecone(rag.get_index(), sys.argv[2])
+    print(f"exported {count} vectors to {sys.argv[2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Structured logging: records are tagged with the request id and written by a background thread.
+
+The request path only formats the message and puts the record on a bounded
+queue; a ``QueueListener`` thread serializes it (JSON lines by default, or the
+old bracketed text with ``ORA_LOG_FORMAT=text``) and does the write. When the
+queue is full, records are dropped and counted rather than blocking a request.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import contextvars
+import logging.handlers
+
+import metrics
+
+LOG_LEVEL = os.getenv("ORA_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("ORA_LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("ORA_LOG_QUEUE_SIZE", "10000"))
+# Libraries that log every upstream call at INFO.
+QUIET_LOGGERS = ("httpx", "httpcore", "openai", "pinecone")
+
+_request_id = contextvars.ContextVar("ora_request_id", default=None)
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+_listener = None
+_stats = {"dropped": 0}
+
+
+def set_request_id(request_id: str):
+    """Tag log records from this context (and tasks spawned from it) with ``request_id``."""
+    return _request_id.set(request_id)
+
+
+def request_id():
+    return _request_id.get()
+
+
+def extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        entry.update(extra_fields(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [f"[{record.name.split('.')[0].upper()} {record.levelname}]"]
+        if record.request_id:
+            parts.append(f"[{record.request_id}]")
+        parts.append(record.getMessage())
+        parts.extend(f"{k}={v}" for k, v in extra_fields(record).items())
+        line = " ".join(parts)
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Resolves the message and request id in the caller, then enqueues without blocking."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = getattr(record, "request_id", None) or _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+def start_listener(logger: logging.Logger, handler: logging.Handler, level=logging.INFO):
+    """Route ``logger`` through a bounded queue to ``handler`` on a background thread."""
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.handlers[:] = [QueueHandler(records)]
+    logger.setLevel(level)
+    return listener
+
+
+def configure():
+    """Install the queue-backed handler on the root logger; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    out = logging.StreamHandler(sys.stderr)
+    out.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = start_listener(logging.getLogger(), out, LOG_LEVEL)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def stats() -> dict:
+    return {**_stats, "queued": _listener.queue.qsize() if _listener is not None else 0}
+
+
+@metrics.collector
+def log_metrics():
+    return [("ora_log_records_dropped_total", "Log records dropped because the log queue was full.", "counter",
+             [({}, _stats["dropped"])])]
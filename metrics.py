@@ -0,0 +1,165 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 90)
+
+_registry = []
+_collectors = []
+_trace = contextvars.ContextVar("ora_trace", default=None)
+_stage = contextvars.ContextVar("ora_stage", default=None)
+
+
+def label_text(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{k}="{str(v)}"' for k, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{label_text(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total, n) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = label_text(self.labelnames + ("le",), key + (bound,))
+                yield f"{self.name}_bucket{labels} {count}"
+            yield f"{self.name}_bucket{label_text(self.labelnames + ('le',), key + ('+Inf',))} {n}"
+            yield f"{self.name}_sum{label_text(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{label_text(self.labelnames, key)} {n}"
+
+
+def collector(fn):
+    """Register a callback returning (name, doc, type, [(labels_dict, value)]) tuples at scrape time."""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        for name, doc, kind, samples in fn():
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{label_text(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+STAGE_LATENCY = Histogram("ora_stage_latency_seconds", "Latency of each pipeline stage.", ("stage",))
+REQUEST_LATENCY = Histogram("ora_request_latency_seconds", "End-to-end request latency.", ("endpoint",))
+REQUESTS = Counter("ora_requests_total", "Answered requests by endpoint and answer source.", ("endpoint", "source"))
+TIMEOUTS = Counter("ora_timeouts_total", "Requests that hit the request timeout.", ("endpoint",))
+LLM_TOKENS = Counter("ora_llm_tokens_total", "Model tokens by stage and kind (prompt, cached, completion).", ("stage", "kind"))
+RETRIEVAL_FALLBACKS = Counter("ora_retrieval_fallbacks_total", "Pinecone failures answered from the local index.")
+RELEVANCE = Counter("ora_relevance_decisions_total", "Relevance decisions by method and result.", ("method", "result"))
+MODEL_ROUTES = Counter("ora_model_routes_total", "Answers by the model the cascade picked.", ("model",))
+CONTEXT_TOKENS = Counter("ora_context_tokens_total", "Reference-material tokens retrieved and left after packing.", ("kind",))
+CACHE_LOOKUPS = Counter("ora_cache_lookups_total", "Answer-level cache lookups by cache and result.", ("cache", "result"))
+
+
+def start_trace() -> dict:
+    """Begin per-request stage accounting for the current context (and tasks spawned from it)."""
+    trace = {"stages_ms": {}, "tokens": {}}
+    _trace.set(trace)
+    return trace
+
+
+def annotate(**fields):
+    """Attach request details (rewritten query, chunk ids) to the current trace, if any."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_LATENCY.observe(seconds, stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages_ms"][name] = round(trace["stages_ms"].get(name, 0) + seconds * 1000, 2)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        record_stage(name, time.perf_counter() - started)
+
+
+def current_stage():
+    """Name of the innermost ``stage()`` block running in this context, if any."""
+    return _stage.get()
+
+
+def record_tokens(stage_name: str, usage):
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+
+    LLM_TOKENS.inc(prompt, stage=stage_name, kind="prompt")
+    if cached:
+        LLM_TOKENS.inc(cached, stage=stage_name, kind="cached")
+    if completion:
+        LLM_TOKENS.inc(completion, stage=stage_name, kind="completion")
+
+    trace = _trace.get()
+    if trace is not None:
+        tokens = trace["tokens"].setdefault(stage_name, {"prompt": 0, "cached": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["cached"] += cached
+        tokens["completion"] += completion
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,305 @@
+import os
+import re
+import threading
+
+from examples import load_examples, normalize_text
+
+# "translate": local dental-term translation, falling back to the LLM.
+# "direct": embed Arabic queries as-is (text-embedding-3-large is multilingual).
+ARABIC_QUERY_MODE = os.getenv("ORA_ARABIC_QUERY_MODE", "translate")
+ROUTER_ENABLED = os.getenv("ORA_QUERY_ROUTER", "1") == "1"
+
+# Frequent misspellings and chat shorthand seen in patient questions.
+DENTAL_SPELLING = {
+    "teath": "teeth",
+    "teeths": "teeth",
+    "tooths": "teeth",
+    "toothe": "tooth",
+    "tooht": "tooth",
+    "toth": "tooth",
+    "gumms": "gums",
+    "wisdon": "wisdom",
+    "widsom": "wisdom",
+    "wisdem": "wisdom",
+    "extration": "extraction",
+    "extraxtion": "extraction",
+    "extrction": "extraction",
+    "extracion": "extraction",
+    "cavaty": "cavity",
+    "cavitys": "cavities",
+    "cavitie": "cavity",
+    "filing": "filling",
+    "fillling": "filling",
+    "fiiling": "filling",
+    "rootcanal": "root canal",
+    "roocanal": "root canal",
+    "canel": "canal",
+    "crwon": "crown",
+    "brases": "braces",
+    "braises": "braces",
+    "implent": "implant",
+    "implnt": "implant",
+    "bleading": "bleeding",
+    "bleding": "bleeding",
+    "sensetive": "sensitive",
+    "sensitiv": "sensitive",
+    "sensativity": "sensitivity",
+    "sensitivty": "sensitivity",
+    "swolen": "swollen",
+    "sweling": "swelling",
+    "swolling": "swelling",
+    "absess": "abscess",
+    "abcess": "abscess",
+    "absces": "abscess",
+    "anestesia": "anesthesia",
+    "dentest": "dentist",
+    "dentis": "dentist",
+    "dentst": "dentist",
+    "whitning": "whitening",
+    "whiteing": "whitening",
+    "flos": "floss",
+    "mouthwsh": "mouthwash",
+    "hurst": "hurts",
+    "hurtz": "hurts",
+    "hert": "hurt",
+    "hurtin": "hurting",
+    "pian": "pain",
+    "painfull": "painful",
+    "u": "you",
+    "ur": "your",
+    "r": "are",
+    "pls": "please",
+    "plz": "please",
+    "bc": "because",
+    "cuz": "because",
+    "wat": "what",
+    "wht": "what",
+    "shud": "should",
+    "shld": "should",
+    "cant": "can't",
+    "dont": "don't",
+    "doesnt": "doesn't",
+    "im": "i'm",
+    "ive": "i've",
+}
+
+COMMON_WORDS = set("""
+a about after again all also am an and any are as at back be because been before being both but by can can't
+could day days did do does doesn't don't during each every feel feels few for from get gets getting go going
+good had has have having he her him his how i i'm i've if in into is it it's its just keep know like long make
+many me more most much my need needs new no normal not now of off often on once one only or other our out over
+please really right same see she should since so some still such take than that the their them then there
+these they this those through time to too under until up us use very want was way we week weeks were what
+when where which while who why will with without would year years yes you your
+ache aches aching adult after bad baby bite biting bleed bleeds braces brush brushing broken cap cause causes
+cavity cavities check checkup child children chipped clean cleaning cold crack cracked crown crowns decay
+dental dentist denture dentures drink eat eating enamel extract extracted extraction face fever filling fillings
+floss fluoride food front gum gums hot hurt hurting hurts implant implants infected infection jaw kid kids loose
+lost molar molars mouth mouthwash nerve night numb orthodontic pain painful painkiller painkillers pus removal remove
+removed root canal sensitive sensitivity smell sore sugar surgery swelling swollen teeth tongue tooth toothache
+toothbrush toothpaste treatment wisdom whitening x ray xray pull pulled fix fixed serious dangerous
+""".split())
+
+# Normalized Arabic (see examples.normalize_text) phrase -> English retrieval term.
+ARABIC_DENTAL_TERMS = {
+    "ضرس العقل": "wisdom tooth",
+    "اضراس العقل": "wisdom teeth",
+    "علاج العصب": "root canal treatment",
+    "حشوه عصب": "root canal treatment",
+    "خلع جراحي": "surgical extraction",
+    "الخلع الجراحي": "surgical extraction",
+    "حافظ مسافه": "space maintainer",
+    "فتح وتصريف": "incision and drainage",
+    "تسوس": "decay",
+    "التسوس": "decay",
+    "حشوه": "filling",
+    "الحشوه": "filling",
+    "خلع": "extraction",
+    "الخلع": "extraction",
+    "عصب": "nerve",
+    "العصب": "nerve",
+    "لثه": "gum",
+    "اللثه": "gums",
+    "تبييض": "whitening",
+    "التبييض": "whitening",
+    "تقويم": "orthodontic braces",
+    "التقويم": "orthodontic braces",
+    "زرعه": "implant",
+    "الزرعه": "implant",
+    "زراعه": "implant",
+    "تلبيسه": "crown",
+    "التلبيسه": "crown",
+    "تركيبه": "denture",
+    "نزيف": "bleeding",
+    "تنزف": "bleeding",
+    "انتفاخ": "swelling",
+    "الانتفاخ": "swelling",
+    "ورم": "swelling",
+    "خراج": "abscess",
+    "صديد": "pus",
+    "جير": "tartar",
+    "الجير": "tartar",
+    "حساسيه": "sensitivity",
+    "الحساسيه": "sensitivity",
+    "الم": "pain",
+    "الالم": "pain",
+    "وجع": "pain",
+    "يوجعني": "pain",
+    "توجعني": "pain",
+    "يعورني": "pain",
+    "تعورني": "pain",
+    "مسكن": "painkiller",
+    "مسكنات": "painkillers",
+    "المسكنات": "painkillers",
+    "مضاد حيوي": "antibiotic",
+    "خيط": "floss",
+    "الخيط": "floss",
+    "غسول": "mouthwash",
+    "معجون": "toothpaste",
+    "فرشاه": "toothbrush",
+    "تفريش": "brushing",
+    "التفريش": "brushing",
+    "طفل": "child",
+    "طفلي": "child",
+    "ولدي": "child",
+    "بنتي": "child",
+    "حار": "hot",
+    "الحار": "hot",
+    "بارد": "cold",
+    "البارد": "cold",
+    "حلا": "sweets",
+    "الحلا": "sweets",
+    "سن": "tooth",
+    "السن": "tooth",
+    "سني": "tooth",
+    "ضرس": "molar",
+    "ضرسي": "molar",
+    "اسنان": "teeth",
+    "الاسنان": "teeth",
+    "اسناني": "teeth",
+    "فك": "jaw",
+    "الفك": "jaw",
+}
+
+# Words that change what is being asked are kept: the local query keys the answer cache and example
+# match, so "why ..." and "how ...", "... after extraction" and "... before extraction", or "hot or cold"
+# and "hot not cold" must not collapse to the same terms.
+ARABIC_QUESTION_TERMS = {
+    "ليش": "why",
+    "لماذا": "why",
+    "كيف": "how",
+    "متي": "when",
+    "هل": "is",
+    "وهل": "is",
+    "وش": "what",
+    "ايش": "what",
+    "ماذا": "what",
+    "لا": "not",
+    # Gulf "ولا" is usually "or" ("مع الحار ولا البارد"), not "and not".
+    "ولا": "or",
+    "او": "or",
+    "بعد": "after",
+    "قبل": "before",
+    "لازم": "must",
+    "ممكن": "can",
+    "شديد": "severe",
+}
+
+# Arabic function words that carry no retrieval meaning once the dental terms are mapped.
+ARABIC_STOPWORDS = {
+    "في", "من", "علي", "عن", "مع", "الي", "و", "عندي", "عنده", "عندها", "فيه", "فيها", "هو", "هي", "انا", "عند", "كل", "كلها",
+    "يعني", "شي", "اسوي", "افعل", "ابي", "ابغي", "اذا", "هذا", "هذه", "جدا", "مره",
+}
+
+# Openers and pronouns that make a question lean on the previous one ("what about for kids?").
+FOLLOW_UP_PREFIXES = (
+    "what about", "how about", "and ", "also ", "same for", "what if", "is it", "does it", "can it", "should i still",
+)
+FOLLOW_UP_WORDS = {"it", "its", "that", "this", "those", "these", "they", "them", "there"}
+ARABIC_FOLLOW_UP_OPENERS = {"وماذا", "ماذا عن", "طيب", "وبالنسبه", "بالنسبه", "واذا", "وهل", "وش عن", "وايش عن", "والاطفال"}
+FOLLOW_UP_MAX_WORDS = 6
+
+_stats = {"translate_calls": 0, "translate_avoided": 0, "rewrite_calls": 0, "rewrite_avoided": 0}
+_stats_lock = threading.Lock()
+
+
+def count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+CLEAN_CHARS_RE = re.compile(r"^[A-Za-z0-9\s'’,.?!-]+$")
+
+
+def build_vocabulary() -> set:
+    vocab = set(COMMON_WORDS)
+    for ex in load_examples():
+        vocab.update(WORD_RE.findall(f"{ex['english']['question']} {ex['english']['answer']}".lower()))
+    vocab.update(w for term in DENTAL_SPELLING.values() for w in term.split())
+    return vocab
+
+
+VOCABULARY = build_vocabulary()
+
+
+def correct_spelling(q: str) -> str:
+    def fix(m):
+        word = m.group(0)
+        return DENTAL_SPELLING.get(word.lower(), word)
+
+    return re.sub(r"[A-Za-z']+", fix, q)
+
+
+def is_clean_english(q: str) -> bool:
+    """True when every word is known vocabulary and punctuation is ordinary, so an LLM rewrite adds nothing."""
+    q = q.strip()
+    if not q or not CLEAN_CHARS_RE.match(q):
+        return False
+    words = WORD_RE.findall(q.lower().replace("’", "'"))
+    return bool(words) and all(w in VOCABULARY or w.isdigit() for w in words)
+
+
+def local_translate(q: str):
+    """Map an Arabic dental question onto English retrieval terms, or None if any word is unknown."""
+    words = normalize_text(q).split()
+    terms = []
+    dental = False
+    i = 0
+    while i < len(words):
+        pair = " ".join(words[i:i + 2])
+        if i + 1 < len(words) and pair in ARABIC_DENTAL_TERMS:
+            terms.append(ARABIC_DENTAL_TERMS[pair])
+            dental = True
+            i += 2
+            continue
+        word = words[i]
+        if word in ARABIC_DENTAL_TERMS:
+            terms.append(ARABIC_DENTAL_TERMS[word])
+            dental = True
+        elif word in ARABIC_QUESTION_TERMS:
+            terms.append(ARABIC_QUESTION_TERMS[word])
+        elif word not in ARABIC_STOPWORDS:
+            return None
+        i += 1
+
+    terms = list(dict.fromkeys(terms))
+    return " ".join(terms) if dental else None
+
+
+def is_follow_up(q: str) -> bool:
+    """True for short questions that only make sense after the previous turn."""
+    text = normalize_text(q)
+    words = text.split()
+    # Longer questions name their own topic ("is it normal for gums to bleed during pregnancy").
+    if not words or len(words) > FOLLOW_UP_MAX_WORDS:
+        return False
+    if text.startswith(FOLLOW_UP_PREFIXES):
+        return True
+    if words[0] in ARABIC_FOLLOW_UP_OPENERS or " ".join(words[:2]) in ARABIC_FOLLOW_UP_OPENERS:
+        return True
+    return any(w in FOLLOW_UP_WORDS for w in words)
@@ -0,0 +1,123 @@
+"""Local relevance gate: retrieval scores plus a tiny logistic classifier over query embeddings.
+
+Confident cases are decided here; only queries in the uncertain band go to the
+gpt-4o-mini relevance check.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from cache import as_vector
+from examples import LANGS, load_examples
+
+# Top dense similarity bounds: at/above HIGH leans relevant, below LOW leans off-topic.
+SCORE_HIGH = float(os.getenv("ORA_RELEVANCE_SCORE_HIGH", "0.45"))
+SCORE_LOW = float(os.getenv("ORA_RELEVANCE_SCORE_LOW", "0.25"))
+# Classifier probabilities that decide on their own, regardless of retrieval score.
+PROB_YES = float(os.getenv("ORA_RELEVANCE_PROB_YES", "0.9"))
+PROB_NO = float(os.getenv("ORA_RELEVANCE_PROB_NO", "0.1"))
+GATE_ENABLED = os.getenv("ORA_RELEVANCE_GATE", "1") == "1"
+
+EXTRA_DENTAL = [
+    "what is a space maintainer",
+    "how long does a root canal take",
+    "why are my teeth yellow",
+    "how often should I floss",
+    "my crown fell off what should I do",
+    "is it normal for gums to bleed during pregnancy",
+    "do I need braces",
+    "what causes bad breath",
+    "my jaw clicks when I open my mouth",
+    "is fluoride safe for kids",
+    "what is incision and drainage",
+    "can a cracked tooth be fixed",
+]
+
+OFF_TOPIC = [
+    "hello how are you",
+    "what is the capital of france",
+    "what's the weather tomorrow",
+    "tell me a joke",
+    "write a python function to sort a list",
+    "who won the football match yesterday",
+    "how do I bake chocolate cake",
+    "what is the best laptop to buy",
+    "translate good morning to spanish",
+    "how do I lose weight fast",
+    "what is bitcoin",
+    "recommend a movie for tonight",
+    "how do I fix my car engine",
+    "what time is it in new york",
+    "my knee hurts when I run",
+    "how to treat a headache",
+    "what are the symptoms of flu",
+    "book a flight to dubai",
+    "ما هي عاصمة فرنسا",
+    "كيف حالك",
+    "وش أفضل مطعم",
+    "كيف أطبخ كبسة",
+    "ركبتي توجعني",
+    "كم سعر الذهب اليوم",
+]
+
+
+def training_set():
+    positives = [ex[lang]["question"] for ex in load_examples() for lang in LANGS] + EXTRA_DENTAL
+    return positives, list(OFF_TOPIC)
+
+
+class RelevanceClassifier:
+    """L2-regularized logistic regression on unit-normalized embeddings."""
+
+    def __init__(self):
+        self.weights = None
+        self.bias = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    @staticmethod
+    def _unit(m: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(m, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return m / norms
+
+    def fit(self, pos_vectors, neg_vectors, epochs: int = 300, lr: float = 0.5, l2: float = 1e-3):
+        x = self._unit(np.vstack([as_vector(v) for v in list(pos_vectors) + list(neg_vectors)]))
+        y = np.concatenate([np.ones(len(pos_vectors)), np.zeros(len(neg_vectors))]).astype(np.float32)
+        # Balance the classes so the short off-topic list is not drowned out.
+        sample_w = np.where(y == 1, len(y) / (2 * len(pos_vectors)), len(y) / (2 * len(neg_vectors)))
+        w = np.zeros(x.shape[1], dtype=np.float32)
+        b = 0.0
+        for _ in range(epochs):
+            p = 1 / (1 + np.exp(-(x @ w + b)))
+            g = (p - y) * sample_w
+            w -= lr * (x.T @ g / len(y) + l2 * w)
+            b -= lr * float(g.mean())
+        with self._lock:
+            self.weights, self.bias = w, b
+
+    def predict(self, vector) -> float:
+        v = self._unit(as_vector(vector))
+        return float(1 / (1 + np.exp(-(v @ self.weights + self.bias))))
+
+
+def decide(top_score, probability):
+    """Return True/False when confident, or None to defer to the LLM check."""
+    if probability is not None:
+        if probability >= PROB_YES:
+            return True
+        if probability <= PROB_NO:
+            return False
+    if top_score is None:
+        return None
+    leans_yes = probability is None or probability >= 0.5
+    if top_score >= SCORE_HIGH and leans_yes:
+        return True
+    if top_score < SCORE_LOW and not leans_yes:
+        return False
+    return None
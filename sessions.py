@@ -0,0 +1,106 @@
+"""Server-side conversation state keyed by session id.
+
+A session keeps the last few turns verbatim and folds older ones into a short
+running summary, so clients only send a session id and the answer prompt stays
+small however long the conversation gets. Sessions live in an in-process LRU
+with a TTL, optionally backed by SQLite (``ORA_SESSION_DB``) so every worker on
+the host sees the same conversations; disk reads and writes run off the event loop.
+"""
+
+import os
+import re
+import json
+import uuid
+import logging
+
+from cache import LRUCache, TieredCache
+
+log = logging.getLogger("ora")
+
+SESSION_DB_PATH = os.getenv("ORA_SESSION_DB", "")
+SESSION_TTL_SECONDS = float(os.getenv("ORA_SESSION_TTL_SECONDS", str(6 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("ORA_SESSION_MAX_ENTRIES", "50000"))
+# Ids are minted by the server (uuid4 hex) so a client cannot pick, or guess, someone else's session.
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Turns kept verbatim after a compaction, and the count that triggers one.
+RECENT_TURNS = int(os.getenv("ORA_SESSION_RECENT_TURNS", "4"))
+COMPACT_AFTER_TURNS = int(os.getenv("ORA_SESSION_COMPACT_AFTER_TURNS", "8"))
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+_store = TieredCache(
+    "session",
+    LRUCache(max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL_SECONDS),
+    path=SESSION_DB_PATH,
+    ttl=SESSION_TTL_SECONDS,
+)
+_stats = {"created": 0, "loads": 0, "compactions": 0, "compacted_turns": 0}
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_id(session_id: str) -> bool:
+    return bool(SESSION_ID_RE.match(session_id))
+
+
+def new_session(turns=None) -> dict:
+    _stats["created"] += 1
+    return {"summary": "", "turns": list(turns or []), "compacted_turns": 0}
+
+
+async def aload(session_id: str):
+    raw = await _store.aget(session_id)
+    if raw is None:
+        return None
+    _stats["loads"] += 1
+    return json.loads(raw)
+
+
+async def aload_or_create(session_id: str, turns=None) -> dict:
+    """Existing session, or a new one seeded with the history the client sent."""
+    return await aload(session_id) or new_session(turns)
+
+
+async def asave(session_id: str, session: dict):
+    # The memory tier is written before the disk write is awaited, so a load right after sees it.
+    await _store.aset(session_id, json.dumps(session, ensure_ascii=False))
+
+
+def history(session: dict) -> list:
+    """Messages for the answer prompt: the summary (when there is one) and the recent turns."""
+    messages = []
+    if session["summary"]:
+        messages.append({"role": "system", "content": SUMMARY_PREFIX + session["summary"]})
+    messages.extend(session["turns"][-COMPACT_AFTER_TURNS:])
+    return messages
+
+
+def append(session: dict, question: str, answer: str):
+    session["turns"].append({"role": "user", "content": question})
+    session["turns"].append({"role": "assistant", "content": answer})
+
+
+def compactable(session: dict) -> list:
+    """Turns to fold into the summary, oldest first; empty until the session is long enough."""
+    if len(session["turns"]) <= COMPACT_AFTER_TURNS:
+        return []
+    return session["turns"][:-RECENT_TURNS]
+
+
+def apply_summary(session: dict, summary: str, folded) -> bool:
+    """Replace ``folded`` with ``summary``; False if the session no longer starts with those turns."""
+    n = len(folded)
+    if session["turns"][:n] != folded:
+        return False
+    session["summary"] = summary
+    session["turns"] = session["turns"][n:]
+    session["compacted_turns"] += n
+    _stats["compactions"] += 1
+    _stats["compacted_turns"] += n
+    return True
+
+
+def stats() -> dict:
+    return {**_stats, "entries": _store.memory.stats()["entries"], "disk": _store.disk is not None}
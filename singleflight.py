@@ -0,0 +1,47 @@
+"""Single-flight call deduplication: concurrent calls with the same key share one execution."""
+
+import asyncio
+
+
+class AsyncSingleFlight:
+    """The call runs as a task shared by every waiter.
+
+    A waiter that is cancelled does not cancel the shared task unless it was the
+    last one waiting on it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        entry = self._calls.get(key)
+        if entry is not None and entry[0].get_loop() is loop and not entry[0].done():
+            self.coalesced += 1
+            entry[1] += 1
+        else:
+            task = loop.create_task(fn())
+            entry = self._calls[key] = [task, 1]
+            self.calls += 1
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+
+        task = entry[0]
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Forget it first: a caller arriving now must start a fresh call, not join a cancelled one.
+                self._forget(key, task)
+                task.cancel()
+            raise
+
+    def _forget(self, key, task):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
@@ -1,12 +1,31 @@
 import os
 import re
+import json
+import hashlib
+import time
+import asyncio
 import logging
+import threading
 from typing import Dict, Any
 
-from openai import OpenAI
-from pinecone import Pinecone
+import numpy as np
 
-logging.basicConfig(level=logging.INFO, format="[ORA %(levelname)s] %(message)s")
+from pinecone import Pinecone, RetryConfig
+
+from cache import SemanticCache, as_vector, text_cache, vector_cache
+from examples import ExampleMatcher, load_examples, normalize_text, render_examples
+import logs
+import metrics
+import query_router
+import lexical
+import relevance_gate
+import context_packing
+import transport
+import sessions
+from local_index import load_local_index
+from singleflight import AsyncSingleFlight
+
+logs.configure()
 log = logging.getLogger("ora")
 
 MODEL = "gpt-4o"
@@ -17,19 +36,148 @@ PINECONE_INDEX = "oraapp777"
 TOP_K = 8
 MAX_ANSWER_TOKENS = 260
 
+# Answers are reused for new questions whose cleaned-query embedding is this close to a past one.
+ANSWER_CACHE_ENABLED = os.getenv("ORA_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ORA_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ORA_ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# Curated bilingual Q&A pairs; a confident local match is answered without any model call.
+EXAMPLE_MATCH_ENABLED = os.getenv("ORA_EXAMPLE_MATCH", "1") == "1"
+EXAMPLE_MATCH_THRESHOLD = float(os.getenv("ORA_EXAMPLE_MATCH_THRESHOLD", "0.9"))
+
+# /ask/batch: items in flight per batch, per-item timeout and inputs per embeddings request.
+BATCH_CONCURRENCY = int(os.getenv("ORA_BATCH_CONCURRENCY", "32"))
+BATCH_ITEM_TIMEOUT_SECONDS = float(os.getenv("ORA_BATCH_ITEM_TIMEOUT_SECONDS", "90"))
+EMBED_BATCH_SIZE = 512
+
+# Start the gpt-4o answer alongside the relevance LLM check instead of after it. Questions the
+# local gate decides never speculate, so a refused question costs no answer call.
+SPECULATIVE_ANSWER = os.getenv("ORA_SPECULATIVE_ANSWER", "1") == "1"
+
+# "pinecone" or "local"; the local snapshot (see local_index.py) also serves as a
+# fallback whenever a Pinecone query fails.
+RETRIEVAL_BACKEND = os.getenv("ORA_RETRIEVAL_BACKEND", "pinecone")
+LOCAL_INDEX_PATH = os.getenv("ORA_LOCAL_INDEX_PATH", "")
+LOCAL_INDEX_FALLBACK = os.getenv("ORA_LOCAL_INDEX_FALLBACK", "1") == "1"
+
+# Model cascade: short questions with strong retrieval or a near-example match are
+# answered by FAST_MODEL; everything else escalates to MODEL. Off until FAST_MODEL's
+# answer quality has been measured on the benchmark set.
+CASCADE_ENABLED = os.getenv("ORA_MODEL_CASCADE", "0") == "1"
+CASCADE_MIN_RERANK = float(os.getenv("ORA_CASCADE_MIN_RERANK", "0.6"))
+CASCADE_MIN_EXAMPLE_SIMILARITY = float(os.getenv("ORA_CASCADE_MIN_EXAMPLE_SIMILARITY", "0.8"))
+CASCADE_MAX_QUERY_WORDS = int(os.getenv("ORA_CASCADE_MAX_QUERY_WORDS", "20"))
+CASCADE_MAX_HISTORY_TURNS = 2
+
+# Reranker score above which the gpt-4o-mini relevance check is skipped.
+RELEVANCE_SKIP_SCORE = float(os.getenv("ORA_RELEVANCE_SKIP_SCORE", "0.75"))
+
+# Concurrent requests made during warm-up, i.e. pooled OpenAI connections opened before traffic.
+WARMUP_CONNECTIONS = int(os.getenv("ORA_WARMUP_CONNECTIONS", "8"))
+
 PINECONE_CHUNK_FIELD = "chunk_text"
 PINECONE_TITLE_FIELD = "title"
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(PINECONE_INDEX)
+# Points both OpenAI and Pinecone at one stand-in server (see bench/fake_upstreams.py).
+UPSTREAM_BASE_URL = os.getenv("ORA_UPSTREAM_BASE_URL", "").rstrip("/")
+OPENAI_BASE_URL = f"{UPSTREAM_BASE_URL}/v1" if UPSTREAM_BASE_URL else None
+
+PINECONE_MAX_RETRIES = int(os.getenv("ORA_PINECONE_MAX_RETRIES", "1"))
+# Optional direct data-plane host; skips the describe_index lookup when set.
+PINECONE_HOST = UPSTREAM_BASE_URL or os.getenv("PINECONE_HOST", "")
+
+# Upstream clients are built on first use, so importing this module never blocks
+# on a control-plane lookup or fails on a missing key; api_server warms them up.
+_client = None
+_aclient = None
+_pc = None
+_index = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Retries, per-stage timeouts and the circuit breaker live in transport.py, so the SDK's own retries are off.
+    global _client
+    if _client is None:
+        from openai import OpenAI  # deferred: importing the SDK alone takes about half a second
+
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=OPENAI_BASE_URL,
+                    http_client=transport.http_client("openai"),
+                    max_retries=0,
+                )
+    return _client
+
+
+def get_aclient():
+    global _aclient
+    if _aclient is None:
+        from openai import AsyncOpenAI
+
+        with _client_lock:
+            if _aclient is None:
+                _aclient = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=OPENAI_BASE_URL,
+                    http_client=transport.async_http_client("openai"),
+                    max_retries=0,
+                )
+    return _aclient
+
+
+def get_pinecone() -> Pinecone:
+    global _pc
+    if _pc is None:
+        with _client_lock:
+            if _pc is None:
+                _pc = Pinecone(
+                    api_key=os.getenv("PINECONE_API_KEY"),
+                    timeout=transport.stage_timeout("pinecone"),
+                    connection_pool_maxsize=transport.POOL_MAX_CONNECTIONS,
+                    retry_config=RetryConfig(
+                        max_retries=PINECONE_MAX_RETRIES,
+                        backoff_factor=transport.BACKOFF_BASE_SECONDS,
+                        max_wait=transport.BACKOFF_CAP_SECONDS,
+                    ),
+                )
+    return _pc
+
+
+def get_index():
+    global _index
+    if _index is None:
+        pc = get_pinecone()
+        with _client_lock:
+            if _index is None:
+                _index = pc.Index(PINECONE_INDEX, host=PINECONE_HOST)
+    return _index
+
+
+_local_index = load_local_index(LOCAL_INDEX_PATH)
+
+# The async data-plane client is built on first use so import does not pay a second lookup.
+_async_index = None
+_async_index_lock = asyncio.Lock()
 
 ARABIC_RE = re.compile(r"[\u0600-\u06FF]")
 
 GREETINGS = {"hi", "hello", "hey", "مرحبا", "هلا", "السلام", "السلام عليكم"}
 
-_query_cache = {}
-_embedding_cache = {}
+_query_cache = text_cache("rewrite")
+_translation_cache = text_cache("translate")
+_embedding_cache = vector_cache("embedding")
+EXAMPLES = load_examples()
+EXAMPLES_TEXT = render_examples(EXAMPLES)
+_example_matcher = ExampleMatcher(EXAMPLES, EXAMPLE_MATCH_THRESHOLD)
+_relevance_classifier = relevance_gate.RelevanceClassifier()
+
+# Identical concurrent calls share one upstream request instead of stampeding the caches.
+_aflights = {name: AsyncSingleFlight() for name in ("answer", "rewrite", "embed")}
+
+_answer_cache = SemanticCache(ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES)
 
 
 def is_ar(text: str) -> bool:
@@ -40,20 +188,43 @@ def is_greeting(q: str) -> bool:
     return q.strip().lower() in GREETINGS
 
 
-def translate_to_english(q: str) -> str:
+async def get_async_index():
+    global _async_index
+    if _async_index is None:
+        async with _async_index_lock:
+            if _async_index is None:
+                pc = get_pinecone()
+                host = PINECONE_HOST or (await asyncio.to_thread(pc.describe_index, PINECONE_INDEX)).host
+                _async_index = pc.IndexAsyncio(host=host)
+    return _async_index
+
+
+def translate_messages(q: str):
+    return [
+        {"role": "system", "content": "Translate to clear English for dental retrieval. Output only translation."},
+        {"role": "user", "content": q},
+    ]
+
+
+async def atranslate_to_english(q: str) -> str:
+    cached = await _translation_cache.aget(q)
+    if cached is not None:
+        return cached
+
     try:
-        r = client.chat.completions.create(
-            model=FAST_MODEL,
-            messages=[
-                {"role": "system", "content": "Translate to clear English for dental retrieval. Output only translation."},
-                {"role": "user", "content": q},
-            ],
-            temperature=0,
-            max_tokens=200,
-        )
-        return (r.choices[0].message.content or "").strip() or q
+        with metrics.stage("translate"):
+            r = await get_aclient().chat.completions.create(
+                model=FAST_MODEL,
+                messages=translate_messages(q),
+                temperature=0,
+                max_tokens=200,
+            )
+        metrics.record_tokens("translate", r.usage)
+        out = (r.choices[0].message.content or "").strip() or q
+        await _translation_cache.aset(q, out)
+        return out
     except Exception as e:
-        log.warning(f"translate_to_english failed: {e}")
+        log.warning(f"atranslate_to_english failed: {e}")
         return q
 
 
@@ -66,107 +237,348 @@ def should_rewrite(q: str) -> bool:
     return False
 
 
-def rewrite_query(q: str) -> str:
-    if q in _query_cache:
-        return _query_cache[q]
+def needs_rewrite(q: str) -> bool:
+    if not should_rewrite(q):
+        return False
+    if query_router.ROUTER_ENABLED and query_router.is_clean_english(q):
+        query_router.count("rewrite_avoided")
+        return False
+    query_router.count("rewrite_calls")
+    return True
+
 
+def local_arabic_query(q: str):
+    """Retrieval query for Arabic input that needs no translate/rewrite call, or None."""
+    if query_router.ARABIC_QUERY_MODE == "direct":
+        local = q
+    elif query_router.ROUTER_ENABLED:
+        local = query_router.local_translate(q)
+    else:
+        local = None
+
+    if local is not None:
+        query_router.count("translate_avoided")
+        log.info("local arabic query", extra={"local_query": local})
+    return local
+
+
+def previous_question(history):
+    """Latest user question that stands on its own, else the latest user question."""
+    questions = [t.get("content") for t in (history or []) if t.get("role") == "user"]
+    for question in reversed(questions):
+        if not query_router.is_follow_up(question):
+            return question
+    return questions[-1] if questions else None
+
+
+async def acontextual_query(q: str, clean_query: str, history=None) -> str:
+    previous = previous_question(history)
+    if not previous or not query_router.is_follow_up(q):
+        return clean_query
+    combined = f"{await aclean_query(previous)} {clean_query}"
+    log.info("follow-up retrieval", extra={"retrieval_query": combined})
+    return combined
+
+
+def rewrite_messages(q: str):
+    return [
+        {
+            "role": "system",
+            "content": "Clean the query for retrieval. Fix typos and informal wording only. Do not change meaning. Do not reinterpret the condition.",
+        },
+        {"role": "user", "content": q},
+    ]
+
+
+async def arewrite_query(q: str) -> str:
+    cached = await _query_cache.aget(q)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        try:
+            with metrics.stage("rewrite"):
+                r = await get_aclient().chat.completions.create(
+                    model=FAST_MODEL,
+                    messages=rewrite_messages(q),
+                    temperature=0,
+                    max_tokens=150,
+                )
+            metrics.record_tokens("rewrite", r.usage)
+            out = (r.choices[0].message.content or "").strip() or q
+            await _query_cache.aset(q, out)
+            return out
+        except Exception as e:
+            log.warning(f"arewrite_query failed: {e}")
+            return q
+
+    return await _aflights["rewrite"].do(q, fetch)
+
+
+async def aembed(text: str):
+    cached = await _embedding_cache.aget(text)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        with metrics.stage("embed"):
+            r = await get_aclient().embeddings.create(model=EMBED_MODEL, input=text)
+        metrics.record_tokens("embed", r.usage)
+        emb = as_vector(r.data[0].embedding)
+        await _embedding_cache.aset(text, emb)
+        return emb
+
+    return await _aflights["embed"].do(text, fetch)
+
+
+async def aensure_example_vectors():
+    if _example_matcher.vectors is not None:
+        return
     try:
-        r = client.chat.completions.create(
-            model=FAST_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Clean the query for retrieval. Fix typos and informal wording only. Do not change meaning. Do not reinterpret the condition.",
-                },
-                {"role": "user", "content": q},
-            ],
-            temperature=0,
-            max_tokens=150,
-        )
-        out = (r.choices[0].message.content or "").strip() or q
-        _query_cache[q] = out
-        return out
+        _example_matcher.set_vectors(await aembed_many(_example_matcher.questions()))
     except Exception as e:
-        log.warning(f"rewrite_query failed: {e}")
-        return q
-
+        log.warning(f"aensure_example_vectors failed: {e}")
 
-def embed(text: str):
-    if text in _embedding_cache:
-        return _embedding_cache[text]
 
-    emb = client.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
-    _embedding_cache[text] = emb
-    return emb
+async def aembed_many(texts):
+    """Embed every uncached text in a single request and fill the embedding cache."""
+    cached = {t: await _embedding_cache.aget(t) for t in dict.fromkeys(texts)}
+    missing = [t for t, v in cached.items() if v is None]
+    if missing:
+        with metrics.stage("embed"):
+            r = await get_aclient().embeddings.create(model=EMBED_MODEL, input=missing)
+        metrics.record_tokens("embed", r.usage)
+        for t, item in zip(missing, r.data):
+            cached[t] = as_vector(item.embedding)
+            await _embedding_cache.aset(t, cached[t])
+    return [cached[t] for t in texts]
 
 
 def extract_text(md: Dict[str, Any]) -> str:
     return str(md.get(PINECONE_CHUNK_FIELD) or "").strip()
 
 
-def retrieve_chunks(query: str):
+# BM25 needs the chunk texts, so it is only available alongside a local snapshot.
+_bm25 = (
+    lexical.BM25Index(_local_index.ids, [extract_text(md) for md in _local_index.metadata])
+    if _local_index is not None and lexical.HYBRID_ENABLED
+    else None
+)
+
+
+def local_query(vector):
+    with metrics.stage("local_index"):
+        return _local_index.query(vector, TOP_K)
+
+
+def pinecone_failed(e: Exception):
+    log.warning(f"pinecone query failed: {e}")
+    if LOCAL_INDEX_FALLBACK and _local_index is not None:
+        metrics.RETRIEVAL_FALLBACKS.inc()
+        return True
+    return False
+
+
+async def aquery_index(vector):
+    if RETRIEVAL_BACKEND == "local" and _local_index is not None:
+        return local_query(vector)
+
     try:
-        res = index.query(vector=embed(query), top_k=TOP_K, include_metadata=True)
-        matches = res.get("matches", [])
+        idx = await get_async_index()
+        with metrics.stage("pinecone"), transport.guard("pinecone"):
+            res = await idx.query(
+                vector=vector.tolist(),
+                top_k=TOP_K,
+                include_metadata=True,
+                timeout=transport.stage_timeout("pinecone"),
+            )
+        return res.get("matches", [])
     except Exception as e:
-        log.warning(f"retrieve_chunks failed: {e}")
-        return []
+        return local_query(vector) if pinecone_failed(e) else []
+
+
+async def aretrieve_chunks(query: str, vector=None):
+    if vector is None:
+        try:
+            vector = await aembed(query)
+        except Exception as e:
+            log.warning(f"aretrieve_chunks failed: {e}")
+            return []
+
+    return hybrid_chunks(query, vector, await aquery_index(vector))
+
+
+def chunk_from_metadata(chunk_id, md, score):
+    text = extract_text(md)
+    if not text:
+        return None
+    return {
+        "id": chunk_id,
+        "title": str(md.get(PINECONE_TITLE_FIELD) or ""),
+        "text": text,
+        "score": score,
+    }
 
+
+def chunks_from_matches(matches):
     chunks = []
-    for m in matches:
-        md = m.get("metadata") or {}
-        text = extract_text(md)
-        if not text:
-            continue
-        chunks.append({
-            "title": str(md.get(PINECONE_TITLE_FIELD) or ""),
-            "text": text,
-        })
+    for i, m in enumerate(matches):
+        chunk = chunk_from_metadata(m.get("id") or f"match-{i}", m.get("metadata") or {}, m.get("score"))
+        if chunk is not None:
+            chunks.append(chunk)
 
     return chunks
 
 
-def is_relevant(q: str, chunks) -> bool:
+def hybrid_chunks(query: str, vector, matches):
+    """Fuse dense matches with BM25 hits (RRF), rerank locally and keep only chunks above the cutoff."""
+    chunks = chunks_from_matches(matches)
+    if not lexical.HYBRID_ENABLED:
+        return chunks
+
+    candidates = {c["id"]: {**c, "dense": c["score"], "bm25": None} for c in chunks}
+    dense_ranking = list(candidates)
+    lexical_ranking = []
+
+    if _bm25 is not None:
+        with metrics.stage("bm25"):
+            hits = _bm25.search(query, TOP_K)
+        unit = vector / (float(np.linalg.norm(vector)) or 1.0)
+        for pos, score in hits:
+            chunk_id = _local_index.ids[pos]
+            c = candidates.get(chunk_id)
+            if c is None:
+                c = chunk_from_metadata(chunk_id, _local_index.metadata[pos], None)
+                if c is None:
+                    continue
+                c = candidates[chunk_id] = {**c, "dense": float(_local_index.vectors[pos] @ unit), "bm25": None}
+            c["bm25"] = score
+            lexical_ranking.append(chunk_id)
+
+    fused = lexical.rrf_fuse(dense_ranking, lexical_ranking)
+    with metrics.stage("rerank"):
+        ranked = lexical.rerank(query, [candidates[i] for i in fused])
+
+    log.info("hybrid retrieval", extra={"dense": len(dense_ranking), "lexical": len(lexical_ranking), "kept": len(ranked)})
+    return ranked
+
+
+def pack_context(chunks):
+    """Dedupe, merge and token-budget retrieved chunks before they reach any prompt."""
+    if not context_packing.PACKING_ENABLED or not chunks:
+        return chunks
+    with metrics.stage("pack"):
+        packed, report = context_packing.pack(chunks)
+    metrics.CONTEXT_TOKENS.inc(report["tokens_in"], kind="retrieved")
+    metrics.CONTEXT_TOKENS.inc(report["tokens_out"], kind="packed")
+    metrics.annotate(context=report)
+    log.info("context packing", extra=report)
+    return packed
+
+
+def locally_relevant(chunks) -> bool:
+    """True when the reranker is confident enough that the relevance LLM call can be skipped."""
+    confident = chunks[0].get("rerank", 0.0) >= RELEVANCE_SKIP_SCORE
+    if confident:
+        metrics.RELEVANCE.inc(method="rerank", result="yes")
+    return confident
+
+
+async def aensure_relevance_classifier():
+    if _relevance_classifier.trained or not relevance_gate.GATE_ENABLED:
+        return
+    positives, negatives = relevance_gate.training_set()
+    try:
+        vectors = await aembed_many(positives + negatives)
+        _relevance_classifier.fit(vectors[:len(positives)], vectors[len(positives):])
+    except Exception as e:
+        log.warning(f"aensure_relevance_classifier failed: {e}")
+
+
+def gate_relevance(chunks, vector=None):
+    """Decide relevance from retrieval scores and the query classifier; None means ask the LLM.
+
+    ``vector`` is the query embedding retrieval used; without it only the scores count.
+    """
+    if locally_relevant(chunks):
+        return True
+    if not relevance_gate.GATE_ENABLED:
+        return None
+
+    probability = None
+    if vector is not None and _relevance_classifier.trained:
+        probability = _relevance_classifier.predict(vector)
+    dense = [c.get("dense", c.get("score")) for c in chunks]
+    dense = [s for s in dense if s is not None]
+    top_score = max(dense) if dense else None
+
+    decision = relevance_gate.decide(top_score, probability)
+    if decision is not None:
+        metrics.RELEVANCE.inc(method="gate", result="yes" if decision else "no")
+    log.info("relevance gate", extra={"top_score": top_score, "probability": probability, "decision": decision})
+    return decision
+
+
+def relevance_messages(q: str, chunks):
+    context = "\n\n".join(c["text"] for c in chunks[:4])
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a relevance checker for a dental health assistant. "
+                "Given a question and retrieved reference material, decide if the "
+                "reference contains information useful for answering the question. "
+                "Answer only yes or no. Say no for greetings or clearly non-dental topics. "
+                "If uncertain, answer yes."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Question: {q}\n\nReference material:\n{context}",
+        },
+    ]
+
+
+async def alocal_relevance(chunks, vector=None):
+    """Relevance decided without an LLM call (no chunks, reranker, gate), or None for the uncertain band."""
     if not chunks:
         return False
 
-    context = "\n\n".join(c["text"] for c in chunks[:4])
+    await aensure_relevance_classifier()
+    return gate_relevance(chunks, vector)
+
 
+async def ais_relevant(q: str, chunks, vector=None) -> bool:
+    decision = await alocal_relevance(chunks, vector)
+    if decision is not None:
+        return decision
+    return await allm_relevant(q, chunks)
+
+
+async def allm_relevant(q: str, chunks) -> bool:
     try:
-        r = client.chat.completions.create(
-            model=FAST_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a relevance checker for a dental health assistant. "
-                        "Given a question and retrieved reference material, decide if the "
-                        "reference contains information useful for answering the question. "
-                        "Answer only yes or no. Say no for greetings or clearly non-dental topics. "
-                        "If uncertain, answer yes."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": f"Question: {q}\n\nReference material:\n{context}",
-                },
-            ],
-            temperature=0,
-            max_tokens=5,
-        )
-        out = (r.choices[0].message.content or "").strip().lower()
-        return out.startswith("yes")
+        with metrics.stage("relevance"):
+            r = await get_aclient().chat.completions.create(
+                model=FAST_MODEL,
+                messages=relevance_messages(q, chunks),
+                temperature=0,
+                max_tokens=5,
+            )
+        metrics.record_tokens("relevance", r.usage)
+        relevant = (r.choices[0].message.content or "").strip().lower().startswith("yes")
+        metrics.RELEVANCE.inc(method="llm", result="yes" if relevant else "no")
+        return relevant
     except Exception as e:
-        log.warning(f"is_relevant failed: {e}")
+        log.warning(f"allm_relevant failed: {e}")
         return True
 
 
-def build_system_prompt(context: str, lang: str) -> str:
+def build_system_prompt() -> str:
+    # Static rules and examples only, so the prefix is byte-identical on every
+    # request and the provider's prompt cache can reuse it.
     return f"""
 You are an oral health assistant.
 
-Output language: {lang}
-
 - Do not hallucinate
 - Answer only what was asked
 - Always use "lost vitality" instead of "nerve died"
@@ -196,238 +608,603 @@ You MUST follow them. Do not default to textbook or formal language.
 
 8. Consistency is required. The same question must always produce the same style and level of detail as the examples.
 
-my tooth hurts
-Tooth pain is usually caused by decay, nerve inflammation, or gum inflammation. Sometimes it comes from another tooth or the sinuses. The exact cause depends on the specific characteristics of the pain you are experiencing and when it happens. If it continues or gets worse, a dental checkup is recommended.
-
-أسناني تعورني
- ألم الأسنان غالباً يكون بسبب تسوس، التهاب في العصب، أو التهاب في اللثة. أحياناً يكون من سن ثاني أو من الجيوب الأنفية. تحديد السبب يعتمد على طبيعة الألم ومتى يظهر. إذا استمر أو زاد ننصحك بزيارة طبيب أسنان.
-
-⸻
-
-I just had a tooth extraction what should I do
-• Bite on gauze for 30 minutes
-• Use a cold compress during the first 30 minutes
-• Do not spit or rinse for 24 hours
-• Do not use a straw for 24 hours
-• Avoid hot or hard food
-• Brush normally but avoid the extraction site
-• Take medications if prescribed
-• Avoid smoking and physical activity for 24 hours
-
-خلعت سني وش أسوي
-• اضغط على قطعة شاش لمدة 30 دقيقة
-• استخدم كمادات باردة خلال أول 30 دقيقة
-• لا تبصق ولا تتمضمض لمدة 24 ساعة
-• لا تستخدم الشفاط لمدة 24 ساعة
-• تجنب الأكل القاسي أو الحار
-• نظف أسنانك بشكل طبيعي مع تجنب مكان الخلع
-• التزم بالأدوية إذا تم وصفها
-• تجنب التدخين والجهد لمدة 24 ساعة
-
-⸻
-
-I had teeth whitening what should I do after
-• Sensitivity after whitening is normal, especially in the first 2–3 days
-• You can use pain relief if needed
-• Avoid staining food and drinks like coffee and tea for 2 weeks
-• Avoid smoking or vaping for 2 weeks
-• Do not use whitening toothpaste
-• Avoid colored toothpaste and mouthwash
-• Use toothpaste for sensitivity and leave it on for a minute before brushing
-• Use floss to reduce staining between teeth
-• Use a non-colored fluoride mouthwash if needed
-
-سويت تبييض وش أسوي بعد
-• الحساسية بعد التبييض طبيعية خاصة أول يومين إلى ثلاثة
-• ممكن تستخدم مسكن إذا كانت مزعجة
-• تجنب القهوة والشاي والأشياء اللي تصبغ لمدة أسبوعين
-• تجنب التدخين أو الفيب لمدة أسبوعين
-• لا تستخدم معجون تبييض
-• تجنب المعاجين أو الغسولات الملونة
-• استخدم معجون للحساسية واتركه دقيقة قبل التفريش
-• استخدام الخيط يساعد يقلل التصبغات
-• ممكن تستخدم غسول فلورايد غير ملون
+{EXAMPLES_TEXT}
+"""
 
- how does surgical extraction work
-• The tooth is evaluated with examination and imaging
-• Local anesthesia is given
-• A small opening is made to reach the tooth
-• Bone may be removed if needed
-• The tooth may be divided into parts
-• Each part is removed carefully
-• The area is cleaned and closed
 
-كيف يتم الخلع الجراحي
-• يتم تقييم الحالة بالفحص والأشعة
-• يتم إعطاء تخدير موضعي
-• يتم عمل فتحة بسيطة للوصول للسن
-• قد يتم إزالة جزء بسيط من العظم
-• قد يتم تقسيم السن لتسهيل الإزالة
-• يتم إزالة الأجزاء بحذر
-• يتم تنظيف المنطقة وإغلاقها
+def build_context_prompt(context: str, lang: str) -> str:
+    return f"""Output language: {lang}
 
-my tooth hurts with sweets
-Pain with sweets usually means early decay or exposed dentin. It improves once the tooth is treated. These cases are usually managed with simple restorations. The earlier it is treated, the easier and simpler the treatment is, and it helps prevent progression to the nerve which increases complexity and cost.
+REFERENCE MATERIAL:
+{context}
+"""
 
-سني يوجعني مع الحلا
-الألم مع الحلا غالباً يدل على بداية تسوس أو انكشاف طبقة من السن. يتحسن بعد العلاج، وغالباً يكون بحشوة بسيطة. كل ما كان العلاج مبكر يكون أسهل وأبسط ويمنع وصول المشكلة للعصب وزيادة التعقيد والتكلفة.
 
-my tooth hurts with hot and cold
-Pain with both hot and cold usually suggests nerve involvement rather than simple sensitivity.
+SYSTEM_PROMPT = build_system_prompt()
 
-سني يوجعني مع الحار والبارد
-الألم مع الحار والبارد غالباً يدل على تأثر العصب وليس مجرد حساسية بسيطة.
 
-should I remove my wisdom tooth
-Wisdom teeth are removed if they cause pain, infection, or do not have enough space. They may also be removed as part of an orthodontic treatment plan. However, if they are healthy, stable, and not causing discomfort such as headaches or jaw pain, they can be left.
+def answer_messages(q: str, chunks, lang: str, history=None):
+    context = "\n\n".join(c["text"] for c in chunks)
 
- اخلع ضرس العقل ولا لا
- ينخلع ضرس العقل إذا سبب ألم أو التهاب أو ما كان فيه مساحة كافية. أحياناً يكون جزء من الخطة العلاجية قبل التقويم. إذا كان سليم وما يسبب أي ألم أو مشاكل في الفك أو إزعاج مثل الصداع، ممكن يترك.
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": build_context_prompt(context, lang)},
+    ]
 
- my doctor made my crown bigger to close the space and now I feel uncomfortable
-Sometimes the crown is made slightly larger to close the space between teeth (interproximal space) and reduce food trapping. If it feels uncomfortable, it may need adjustment. Another option is closing the space with orthodontic treatment. Keeping the area clean with proper flossing is important to prevent gum irritation.
+    if history:
+        messages.extend(history)
 
-الدكتور كبر التلبيسة عشان يقفل الفراغ وأنا متضايق
-أحياناً يتم تكبير التلبيسة لإغلاق الفراغ بين الأسنان بهدف تقليل دخول الأكل بينها. إذا كانت غير مريحة، ممكن تحتاج تعديل. خيار آخر هو إغلاق الفراغ بالتقويم بعد تعديل التلبيسة لحجم مناسب لحجم السن الطبيعي. ومهم جداً تنظيف المنطقة جيداً باستخدام الخيط السني لتجنب التهاب اللثة.
+    messages.append({"role": "user", "content": q})
+    return messages
 
-my child has swelling and pain is it serious
-Swelling with dental pain usually indicates an infection that has reached the nerve. It is not dangerous, but it should not be ignored and needs early treatment to prevent it from worsening or spreading to surrounding tissues.
 
-طفل عنده انتفاخ وألم هل هو خطير
-الانتفاخ مع الألم غالباً يدل على وجود التهاب وصل للعصب. هو غير خطير لكن ما يتجاهل ويحتاج علاج مبكر عشان ما يزيد أو يمتد للأنسجة المحيطة.
+@metrics.collector
+def cache_metrics():
+    caches = {
+        "rewrite": _query_cache.stats(),
+        "translate": _translation_cache.stats(),
+        "embedding": _embedding_cache.stats(),
+        "semantic_answer": _answer_cache.stats(),
+    }
+    router = query_router.stats()
+    flights = {name: flight.stats() for name, flight in _aflights.items()}
+    return [
+        (
+            "ora_cache_entries",
+            "Entries held in each in-process cache.",
+            "gauge",
+            [({"cache": name}, st["entries"]) for name, st in caches.items()],
+        ),
+        (
+            "ora_cache_hits_total",
+            "Cache hits by cache.",
+            "counter",
+            [({"cache": name}, st["hits"]) for name, st in caches.items()],
+        ),
+        (
+            "ora_cache_misses_total",
+            "Cache misses by cache.",
+            "counter",
+            [({"cache": name}, st["misses"]) for name, st in caches.items()],
+        ),
+        (
+            "ora_router_total",
+            "Translate/rewrite calls made or avoided by the local query router.",
+            "counter",
+            [({"event": name}, value) for name, value in router.items()],
+        ),
+        (
+            "ora_singleflight_coalesced_total",
+            "Calls that joined an identical in-flight call instead of running their own.",
+            "counter",
+            [({"call": name}, st["coalesced"]) for name, st in flights.items()],
+        ),
+        (
+            "ora_session_events_total",
+            "Server-side session creations, loads and compactions.",
+            "counter",
+            [
+                ({"event": k}, v)
+                for k, v in sessions.stats().items()
+                if k in ("created", "loads", "compactions", "compacted_turns")
+            ],
+        ),
+    ]
+
+
+def record_usage(usage):
+    """Record an answer completion's ``usage`` block; totals are ora_llm_tokens_total{stage="answer"}."""
+    metrics.record_tokens("answer", usage)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    log.info("answer usage", extra={
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": cached,
+        "uncached_tokens": usage.prompt_tokens - cached,
+        "completion_tokens": usage.completion_tokens,
+    })
+
+
+def choose_model(q: str, chunks, query_vector=None, history=None) -> dict:
+    """Pick the answer model for this question; returns {model, reasons, signals}."""
+    rerank = chunks[0].get("rerank", 0.0) if chunks else 0.0
+    example_similarity = _example_matcher.match_vector(query_vector)[1] if query_vector is not None else 0.0
+    words = len(q.split())
+    turns = len(history or [])
+    signals = {
+        "rerank": round(rerank, 3),
+        "example_similarity": round(example_similarity, 3),
+        "query_words": words,
+        "history_turns": turns,
+    }
 
-can we extract a tooth while there is swelling
-It depends on the case. If the swelling is localized, the tooth can often be treated with either extraction or root canal treatment depending on the clinical decision. However, if the swelling is severe, treatment may be delayed until it is controlled with antibiotics, and sometimes incision and drainage may be needed. Severe swelling can reduce anesthesia effectiveness and limit mouth opening, making treatment more difficult. If antibiotics are used to control the swelling, the root cause must still be treated to prevent it from returning even if symptoms improve.
+    if not CASCADE_ENABLED:
+        return {"model": MODEL, "reasons": ["cascade_disabled"], "signals": signals}
+
+    confident = []
+    if rerank >= CASCADE_MIN_RERANK:
+        confident.append("strong_retrieval")
+    if example_similarity >= CASCADE_MIN_EXAMPLE_SIMILARITY:
+        confident.append("near_example")
+
+    escalate = []
+    if not confident:
+        escalate.append("low_confidence")
+    if words > CASCADE_MAX_QUERY_WORDS:
+        escalate.append("long_query")
+    if turns > CASCADE_MAX_HISTORY_TURNS:
+        escalate.append("long_history")
+
+    model = MODEL if escalate else FAST_MODEL
+    log.info("model cascade", extra={"model": model, "reasons": escalate or confident, "signals": signals})
+    return {"model": model, "reasons": escalate or confident, "signals": signals}
+
+
+async def aanswer_from_chunks(q: str, chunks, lang: str, history=None, model: str = MODEL):
+    with metrics.stage("answer"):
+        r = await get_aclient().chat.completions.create(
+            model=model,
+            messages=answer_messages(q, chunks, lang, history),
+            temperature=0,
+            max_tokens=MAX_ANSWER_TOKENS,
+        )
+    record_usage(r.usage)
 
-نقدر نخلع السن وهو فيه انتفاخ
-يعتمد على الحالة. إذا كان الانتفاخ بسيط ومحدد، ممكن يتم العلاج إما بالخلع أو علاج العصب حسب قرار الطبيب. أما إذا كان الانتفاخ شديد، قد يتم تأجيل العلاج حتى يتم التحكم فيه باستخدام مضاد حيوي، وأحياناً يحتاج فتح وتصريف، يعني يتم عمل فتحة بسيطة لتفريغ الصديد وتخفيف الضغط.
-إذا تم استخدام المضاد الحيوي لتخفيف الانتفاخ مؤقتاً قبل العلاج، هذا لا يعني أن المشكلة الأساسية انحلت. لازم علاج السبب الرئيسي بعد ذلك، لأن إهماله ممكن يخلي الانتفاخ يرجع مرة ثانية.
+    return (r.choices[0].message.content or "").strip()
 
-⸻
 
-my child has decay should we extract or do root canal
-The decision depends on how deep the decay is. If it is simple, it is treated with a filling. If it reaches the nerve, a root canal may be needed. If the tooth is severely damaged, it may be removed and a space maintainer may be placed. The goal is to keep the tooth whenever possible to maintain space and guide proper eruption.
+def estimate_tokens(messages) -> int:
+    # Rough 4-chars-per-token estimate; cancelled calls never return usage.
+    return sum(len(m["content"]) for m in messages) // 4
 
-طفل عنده تسوس نخلع ولا نسوي عصب
-القرار يعتمد على عمق التسوس. إذا كان بسيط يتعالج بحشوة. إذا وصل للعصب يحتاج علاج عصب. إذا كان متضرر بشكل كبير ممكن ينخلع وقد يتم وضع حافظ مسافة. الهدف من الحفاظ على السن اللبني إذا أمكن هو المساعدة في الحفاظ على المسافات وتوجيه بزوغ الأسنان الدائمة بشكل صحيح.
 
-my gums bleed when I brush what should I do
-Bleeding gums usually indicate gum inflammation caused by plaque buildup. Plaque is a layer of food debris and bacteria that forms on teeth and can be removed by brushing and flossing. If not removed, it hardens into calculus which can only be removed by a dentist. Improving oral hygiene is essential by brushing twice daily, flossing, using mouthwash, and cleaning the tongue. Night brushing and flossing are especially important. Professional cleaning is recommended every six months.
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
 
-اللثة تنزف عند التفريش ماذا أفعل
-نزيف اللثة غالباً يكون بسبب التهاب ناتج عن تراكم البلاك. البلاك هو طبقة من بقايا الطعام والبكتيريا ويمكن إزالته بالتفريش والخيط السني. إذا لم تتم إزالته يتحول إلى جير لا يمكن إزالته إلا عند طبيب الأسنان. تحسين العناية مهم من خلال التفريش مرتين يومياً، استخدام الخيط السني، غسول الفم، وتنظيف اللسان. التفريش والخيط السني قبل النوم مهم جداً. ينصح بعمل تنظيف دوري عند طبيب الأسنان كل ستة أشهر.
 
-I had an implant and my gum looks bluish is that normal
-A bluish color around an implant can happen when the gum is thin and slightly transparent. It is usually a cosmetic issue and not a disease.
+async def aspeculative_answer(q: str, clean_query: str, chunks, lang: str, history=None, model: str = MODEL,
+                              vector=None):
+    """Answer if relevant, else return None.
 
-لون اللثة حول الزرعة أزرق هل هذا طبيعي
-اللون الأزرق حول الزرعة ممكن يظهر إذا كانت اللثة رقيقة وشفافة قليلاً، وغالباً يكون موضوع تجميلي وليس مشكلة مرضية.
+    The local gate decides first; only when it defers to the LLM check does the
+    answer start alongside that check.
+    """
+    decision = await alocal_relevance(chunks, vector)
+    if decision is not None:
+        return await aanswer_from_chunks(q, chunks, lang, history, model) if decision else None
 
-I had a filling and now it hurts when I bite
-Pain when biting after a filling usually means the filling is slightly high and needs adjustment.
+    relevance_task = asyncio.create_task(timed(allm_relevant(clean_query, chunks)))
+    answer_task = asyncio.create_task(timed(aanswer_from_chunks(q, chunks, lang, history, model)))
 
-بعد الحشوة أحس بألم عند العضة
-الألم عند العضة بعد الحشوة غالباً يعني أن الحشوة مرتفعة وتحتاج تعديل بسيط.
+    try:
+        relevant, relevance_ms = await relevance_task
 
-severe tooth pain disappeared on its own what does it mean
-Disappearance of severe tooth pain may indicate that the tooth has lost its vitality. This does not mean the problem is resolved and usually requires proper evaluation. Treatment often involves root canal therapy after confirmation through clinical and radiographic examination.
+        if not relevant:
+            answer_task.cancel()
+            wasted = estimate_tokens(answer_messages(q, chunks, lang, history))
+            log.info("speculative answer cancelled",
+                     extra={"relevance_ms": round(relevance_ms), "wasted_prompt_tokens": wasted})
+            return None
 
-ألم شديد في السن واختفى فجأة ماذا يعني
-اختفاء الألم الشديد قد يدل على أن السن فقد حيويته. هذا لا يعني أن المشكلة انتهت، وغالباً يحتاج تقييم دقيق وقد يتطلب علاج عصب بعد الفحص السريري والأشعة.
+        answer, answer_ms = await answer_task
+    finally:
+        relevance_task.cancel()
+        answer_task.cancel()
 
-what does it mean when a tooth rots
-Tooth rotting usually refers to untreated decay that damages the tooth over time.
+    saved_ms = relevance_ms + answer_ms - max(relevance_ms, answer_ms)
+    log.info("speculative answer",
+             extra={"relevance_ms": round(relevance_ms), "answer_ms": round(answer_ms), "saved_ms": round(saved_ms)})
+    return answer
 
-ماذا يعني أن السن يتعفن
-تعفن السن يقصد فيه تسوس مهمل أدى إلى تلف السن مع الوقت.
 
-my final wisdom tooth is coming in and it hurts so bad
-Pain with a wisdom tooth coming in is usually due to inflammation of the gum over the tooth, lack of space causing pressure, or decay if part of the tooth is exposed.
+def greeting_answer(ar: bool):
+    return {
+        "answer": "كيف أقدر أساعدك؟" if ar else "How can I help you?",
+        "refs": [],
+        "source": "model",
+    }
 
- ضرس العقل يعورني
- ألم ضرس العقل غالباً يكون بسبب التهاب في اللثة حوله، أو ضغط بسبب عدم وجود مساحة كافية، أو تسوس إذا كان جزء منه مكشوف.
 
-all my teeth hurt
-Pain that feels like it's affecting all teeth can happen with generalized gum inflammation or when one irritated tooth causes pain that spreads.
+def irrelevant_answer(ar: bool):
+    return {
+        "answer": "أقدر أساعد فقط في أسئلة صحة الفم والأسنان" if ar else "I can only help with oral health related questions.",
+        "refs": [],
+        "source": "model",
+    }
 
-أسناني كلها توجعني
-الإحساس بأن كل الأسنان تؤلم ممكن يكون بسبب التهاب عام في اللثة أو بسبب سن واحد وينتشر الألم لباقي الأسنان.
 
-nothing helps and all my teeth hurt
-Widespread pain that does not improve often points to a deeper issue like nerve inflammation where pain is felt across multiple teeth.
+def refs_from_chunks(chunks):
+    return list({c["title"] for c in chunks if c["title"]})[:3]
 
-ولا شي يخفف الألم وكل أسناني تعورني
-إذا الألم منتشر وما يتحسن غالباً يكون بسبب مشكلة أعمق مثل التهاب في العصب ويكون الإحساس بالألم في أكثر من سن.
 
-will painkillers fix the pain
-Painkillers reduce the pain temporarily but do not treat the underlying cause such as decay or inflammation.
+def example_answer(i: int, lang: str):
+    return {
+        "answer": _example_matcher.answer(i, lang),
+        "refs": [],
+        "source": "example",
+    }
 
-المسكنات تعالج ألم الأسنان
-المسكنات تخفف الألم مؤقتاً لكنها لا تعالج السبب مثل التسوس أو الالتهاب.
 
-REFERENCE MATERIAL:
-{context}
-"""
+def match_example_text(q: str, lang: str):
+    i = _example_matcher.match_text(q)
+    metrics.record_cache("example_text", i is not None)
+    if i is None:
+        return None
+    log.info("example match by text", extra={"example": i})
+    return example_answer(i, lang)
 
 
-def answer_from_chunks(q: str, chunks, lang: str, history=None):
-    context = "\n\n".join(c["text"] for c in chunks)
-    system = build_system_prompt(context, lang)
+def match_example_vector(vector, lang: str):
+    i, score = _example_matcher.match_vector(vector)
+    metrics.record_cache("example_vector", i is not None)
+    if i is None:
+        return None
+    log.info("example match by embedding", extra={"example": i, "similarity": round(score, 3)})
+    return example_answer(i, lang)
 
-    messages = [{"role": "system", "content": system}]
 
-    if history:
-        messages.extend(history)
+def lookup_cached_answer(lang: str, vector):
+    if vector is None:
+        return None
+    cached, score = _answer_cache.lookup(lang, vector)
+    metrics.record_cache("answer", cached is not None)
+    if cached is None:
+        return None
+    log.info("answer cache hit", extra={"lang": lang, "similarity": round(score, 3)})
+    return {**cached, "refs": list(cached["refs"])}
 
-    messages.append({"role": "user", "content": q})
 
-    r = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        temperature=0,
-        max_tokens=MAX_ANSWER_TOKENS,
-    )
+def store_cached_answer(lang: str, vector, result: dict):
+    if vector is not None and result.get("source") == "rag":
+        cached = {k: v for k, v in result.items() if k != "routing"}
+        _answer_cache.add(lang, vector, {**cached, "refs": list(result["refs"])})
 
-    return (r.choices[0].message.content or "").strip()
+
+def flight_key(q: str, history=None):
+    """Coalescing key for a request: normalized question, language and a hash of the history."""
+    q = (q or "").strip()
+    history_hash = hashlib.sha1(json.dumps(history or [], sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return normalize_text(q), "arabic" if is_ar(q) else "english", history_hash.hexdigest()
 
 
 def generate_answer(q: str, history=None):
+    """Blocking wrapper over ``agenerate_answer`` for scripts; see ``run_sync``."""
+    return run_sync(agenerate_answer(q, history))
+
+
+async def aclean_query(q: str) -> str:
+    if is_ar(q):
+        local = local_arabic_query(q)
+        if local is not None:
+            return local
+        query_router.count("translate_calls")
+        base_query = await atranslate_to_english(q)
+    else:
+        base_query = query_router.correct_spelling(q) if query_router.ROUTER_ENABLED else q
+
+    if not needs_rewrite(base_query):
+        return base_query
+    return await arewrite_query(base_query)
+
+
+async def aprepare_answer(q: str, history=None) -> dict:
+    """Run every stage before the answer model.
+
+    Returns a context dict; ``result`` is set when the pipeline already has the
+    final answer (greeting, example, cache hit or no chunks retrieved).
+    """
     q = (q or "").strip()
-    log.info(f"QUESTION: {q}")
+    log.debug("QUESTION: %s", q)
 
     ar = is_ar(q)
     lang = "arabic" if ar else "english"
+    ctx = {"q": q, "ar": ar, "lang": lang, "history": history, "result": None}
 
     if is_greeting(q):
-        return {
-            "answer": "كيف أقدر أساعدك؟" if ar else "How can I help you?",
-            "refs": [],
-            "source": "model",
-        }
+        ctx["result"] = greeting_answer(ar)
+        return ctx
 
-    base_query = translate_to_english(q) if ar else q
+    if EXAMPLE_MATCH_ENABLED:
+        ctx["result"] = match_example_text(q, lang)
+        if ctx["result"] is not None:
+            return ctx
 
-    if should_rewrite(base_query):
-        clean_query = rewrite_query(base_query)
-    else:
-        clean_query = base_query
+    clean_query = await acontextual_query(q, await aclean_query(q), history)
+    metrics.annotate(rewritten_query=clean_query)
 
-    chunks = retrieve_chunks(clean_query)
+    # Retrieval and the relevance gate need this embedding anyway; the answer cache and example
+    # match only use it without history, since a follow-up's answer depends on the turns before it.
+    vector = None
+    try:
+        vector = await aembed(clean_query)
+    except Exception as e:
+        log.warning(f"query embed failed: {e}")
+    query_vector = vector if not history and (ANSWER_CACHE_ENABLED or EXAMPLE_MATCH_ENABLED) else None
 
-    if not is_relevant(clean_query, chunks):
-        return {
-            "answer": "أقدر أساعد فقط في أسئلة صحة الفم والأسنان" if ar else "I can only help with oral health related questions.",
-            "refs": [],
-            "source": "model",
-        }
+    ctx["clean_query"] = clean_query
+    ctx["vector"] = vector
+    ctx["query_vector"] = query_vector
 
-    answer = answer_from_chunks(q, chunks, lang, history)
-    log.info(f"ANSWER: {answer}")
+    if EXAMPLE_MATCH_ENABLED and query_vector is not None:
+        await aensure_example_vectors()
+        ctx["result"] = match_example_vector(query_vector, lang)
+        if ctx["result"] is not None:
+            return ctx
 
-    refs = list({c["title"] for c in chunks if c["title"]})[:3]
+    if ANSWER_CACHE_ENABLED:
+        ctx["result"] = lookup_cached_answer(lang, query_vector)
+        if ctx["result"] is not None:
+            return ctx
 
-    return {
+    chunks = await aretrieve_chunks(clean_query, vector) if vector is not None else []
+    metrics.annotate(chunk_ids=[c["id"] for c in chunks])
+    chunks = ctx["chunks"] = pack_context(chunks)
+
+    if not chunks:
+        ctx["result"] = irrelevant_answer(ar)
+    else:
+        ctx["routing"] = choose_model(clean_query, chunks, query_vector, history)
+
+    return ctx
+
+
+def finish_answer(ctx: dict, answer: str) -> dict:
+    # Counted here, once an answer exists, so requests refused as irrelevant are not routes.
+    metrics.MODEL_ROUTES.inc(model=ctx["routing"]["model"])
+    log.debug("ANSWER: %s", answer)
+
+    result = {
         "answer": answer,
-        "refs": refs,
+        "refs": refs_from_chunks(ctx["chunks"]),
         "source": "rag",
+        "routing": ctx["routing"],
     }
+    store_cached_answer(ctx["lang"], ctx["query_vector"], result)
+    return result
+
+
+async def agenerate_answer(q: str, history=None):
+    """Answer a question; identical concurrent questions share one pipeline run."""
+    return await _aflights["answer"].do(flight_key(q, history), lambda: acompute_answer(q, history))
+
+
+async def acompute_answer(q: str, history=None):
+    ctx = await aprepare_answer(q, history)
+    if ctx["result"] is not None:
+        return ctx["result"]
+
+    q, lang, chunks, clean_query = ctx["q"], ctx["lang"], ctx["chunks"], ctx["clean_query"]
+    model = ctx["routing"]["model"]
+
+    if SPECULATIVE_ANSWER:
+        answer = await aspeculative_answer(q, clean_query, chunks, lang, history, model, ctx["vector"])
+        if answer is None:
+            return irrelevant_answer(ctx["ar"])
+    else:
+        if not await ais_relevant(clean_query, chunks, ctx["vector"]):
+            return irrelevant_answer(ctx["ar"])
+
+        answer = await aanswer_from_chunks(q, chunks, lang, history, model)
+
+    return finish_answer(ctx, answer)
+
+
+async def astream_answer(q: str, history=None):
+    """Async generator of answer events: one ``meta`` (refs), ``token`` deltas, then ``done`` (source).
+
+    Greeting, example, cache and irrelevance results are emitted as a single token.
+    """
+    ctx = await aprepare_answer(q, history)
+    result = ctx["result"]
+
+    if result is None:
+        q, lang, chunks, clean_query = ctx["q"], ctx["lang"], ctx["chunks"], ctx["clean_query"]
+
+        def open_stream():
+            return get_aclient().chat.completions.create(
+                model=ctx["routing"]["model"],
+                messages=answer_messages(q, chunks, lang, history),
+                temperature=0,
+                max_tokens=MAX_ANSWER_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+        stream_started = time.perf_counter()
+        relevance_task = stream_task = stream = None
+        relevant = await alocal_relevance(chunks, ctx["vector"])
+        if relevant is None:
+            # Uncertain band: open the answer stream while the LLM check runs.
+            relevance_task = asyncio.create_task(allm_relevant(clean_query, chunks))
+            stream_task = asyncio.create_task(open_stream()) if SPECULATIVE_ANSWER else None
+
+        try:
+            if relevance_task is not None:
+                relevant = await relevance_task
+            if not relevant:
+                result = irrelevant_answer(ctx["ar"])
+            else:
+                yield {"event": "meta", "refs": refs_from_chunks(chunks)}
+
+                stream = await (stream_task or open_stream())
+                parts = []
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        record_usage(chunk.usage)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if not parts:
+                            first_token = time.perf_counter() - stream_started
+                            metrics.record_stage("first_token", first_token)
+                            log.info("stream first token", extra={"first_token_ms": round(first_token * 1000)})
+                        parts.append(delta)
+                        yield {"event": "token", "text": delta}
+
+                metrics.record_stage("answer", time.perf_counter() - stream_started)
+                result = finish_answer(ctx, "".join(parts).strip())
+                yield {"event": "done", "source": result["source"], "routing": result["routing"]}
+                return
+        finally:
+            if relevance_task is not None:
+                relevance_task.cancel()
+            if stream_task is not None:
+                stream_task.cancel()
+                if stream is None and stream_task.done() and not stream_task.cancelled() and not stream_task.exception():
+                    stream = stream_task.result()
+            if stream is not None:
+                await stream.close()
+
+    yield {"event": "meta", "refs": result["refs"]}
+    yield {"event": "token", "text": result["answer"]}
+    yield {"event": "done", "source": result["source"]}
+
+
+def summary_messages(summary: str, turns):
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a patient's conversation with a dental assistant. "
+                "Merge the new turns into the summary. Keep symptoms, teeth involved, ages, treatments "
+                "mentioned and advice already given. At most 80 words, same language as the conversation. "
+                "Output only the summary."
+            ),
+        },
+        {"role": "user", "content": f"Summary so far: {summary or '(none)'}\n\nNew turns:\n{transcript}"},
+    ]
+
+
+async def asummarize_history(summary: str, turns):
+    try:
+        with metrics.stage("summary"):
+            r = await get_aclient().chat.completions.create(
+                model=FAST_MODEL,
+                messages=summary_messages(summary, turns),
+                temperature=0,
+                max_tokens=160,
+            )
+        metrics.record_tokens("summary", r.usage)
+        return (r.choices[0].message.content or "").strip() or None
+    except Exception as e:
+        log.warning(f"asummarize_history failed: {e}")
+        return None
+
+
+async def acompact_session(session_id: str):
+    """Fold a session's older turns into its summary; runs after the answer has been returned."""
+    session = await sessions.aload(session_id)
+    folded = sessions.compactable(session) if session else []
+    if not folded:
+        return
+    summary = await asummarize_history(session["summary"], folded)
+    if summary is None:
+        return
+    # Another request may have written the session meanwhile; only apply onto the same prefix.
+    latest = await sessions.aload(session_id)
+    if latest is not None and sessions.apply_summary(latest, summary, folded):
+        await sessions.asave(session_id, latest)
+        log.info("session compacted", extra={"session_id": session_id, "folded_turns": len(folded), "summary_chars": len(summary)})
+
+
+async def awarm_up(connections: int = WARMUP_CONNECTIONS) -> dict:
+    """Build the clients, open pooled connections and fill the startup embeddings.
+
+    The example questions and the relevance classifier's training set are
+    embedded in ``connections`` concurrent requests, which leaves that many warm
+    connections in the OpenAI pool. Returns {component: "ok" or an error}.
+    """
+    status = {}
+    started = time.perf_counter()
+
+    try:
+        get_aclient()
+        positives, negatives = relevance_gate.training_set()
+        texts = list(dict.fromkeys(_example_matcher.questions() + positives + negatives))
+        size = max(-(-len(texts) // max(connections, 1)), 1)
+        await asyncio.gather(*(aembed_many(texts[i:i + size]) for i in range(0, len(texts), size)))
+        await aensure_example_vectors()
+        await aensure_relevance_classifier()
+        status["openai"] = "ok"
+    except Exception as e:
+        status["openai"] = f"error: {e}"
+
+    if RETRIEVAL_BACKEND == "local" and _local_index is not None:
+        status["pinecone"] = "skipped"
+    else:
+        try:
+            idx = await get_async_index()
+            with transport.guard("pinecone"):
+                await idx.describe_index_stats()
+            status["pinecone"] = "ok"
+        except Exception as e:
+            status["pinecone"] = f"error: {e}"
+
+    status["local_index"] = "ok" if _local_index is not None else "absent"
+    log.info(f"warm-up finished ms={(time.perf_counter() - started) * 1000:.0f} status={status}")
+    return status
+
+
+def batch_error(source: str, answer: str) -> dict:
+    return {"answer": answer, "refs": [], "source": source}
+
+
+async def agenerate_answers(queries, concurrency: int = BATCH_CONCURRENCY, item_timeout: float = BATCH_ITEM_TIMEOUT_SECONDS):
+    """Answer many questions at once; results are returned in order and failures stay per-item.
+
+    Translation/rewrite run concurrently, every uncached cleaned query is embedded
+    in one request, then each item runs the normal pipeline (hitting those caches)
+    with at most ``concurrency`` items in flight.
+    """
+    queries = [(q or "").strip() for q in queries]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def clean(q):
+        if is_greeting(q) or (EXAMPLE_MATCH_ENABLED and _example_matcher.match_text(q) is not None):
+            return None
+        async with semaphore:
+            return await aclean_query(q)
+
+    cleaned = await asyncio.gather(*(clean(q) for q in queries), return_exceptions=True)
+    to_embed = [c for c in cleaned if isinstance(c, str)]
+    try:
+        for i in range(0, len(to_embed), EMBED_BATCH_SIZE):
+            await aembed_many(to_embed[i:i + EMBED_BATCH_SIZE])
+    except Exception as e:
+        log.warning(f"agenerate_answers batch embed failed: {e}")
+
+    async def answer(q):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(agenerate_answer(q), timeout=item_timeout)
+            except asyncio.TimeoutError:
+                return batch_error("timeout", "Request timed out.")
+            except Exception as e:
+                log.warning(f"agenerate_answers item failed: {e}")
+                return batch_error("server_error", "Server error.")
+
+    return await asyncio.gather(*(answer(q) for q in queries))
+
+
+_sync_loop = None
+
+
+def run_sync(coro):
+    """Run ``coro`` to completion for blocking callers; do not call from inside a running event loop.
+
+    Reuses one private loop because ``aclient`` and the async index keep
+    connections bound to the loop they were first used on.
+    """
+    global _sync_loop
+    if _sync_loop is None:
+        _sync_loop = asyncio.new_event_loop()
+    return _sync_loop.run_until_complete(coro)
+
+
+def generate_answers(queries, **kwargs):
+    """Blocking wrapper over ``agenerate_answers`` for scripts; see ``run_sync``."""
+    return run_sync(agenerate_answers(queries, **kwargs))
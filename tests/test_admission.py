@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionQueue, RateLimiter, Rejected, client_key, key_digest
+
+
+def test_slots_are_granted_up_to_the_limit_then_handed_over_fifo():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=1, max_queued=2, max_queue_seconds=1)
+        first = await queue.acquire()
+        order = []
+
+        async def wait(name):
+            slot = await queue.acquire()
+            order.append(name)
+            return slot
+
+        waiters = [asyncio.ensure_future(wait(n)) for n in ("a", "b")]
+        await asyncio.sleep(0.01)
+        assert queue.stats()["queued"] == 2
+        first.release()
+        second = await waiters[0]
+        assert queue.in_flight == 1
+        second.release()
+        (await waiters[1]).release()
+        assert order == ["a", "b"]
+        assert queue.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected_immediately():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=1, max_queued=0, max_queue_seconds=1)
+        slot = await queue.acquire()
+        with pytest.raises(Rejected) as e:
+            await queue.acquire()
+        assert (e.value.status_code, e.value.reason) == (503, "queue_full")
+        assert e.value.retry_after >= 1
+        slot.release()
+
+    asyncio.run(run())
+
+
+def test_queue_wait_times_out():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=1, max_queued=1, max_queue_seconds=0.01)
+        slot = await queue.acquire()
+        with pytest.raises(Rejected) as e:
+            await queue.acquire()
+        assert e.value.reason == "queue_timeout"
+        assert queue.queued == 0
+        slot.release()
+        assert queue.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=1, max_queued=1, max_queue_seconds=1)
+        slot = await queue.acquire()
+        waiter = asyncio.ensure_future(queue.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slot.release()
+        assert queue.stats()["in_flight"] == 0
+        assert queue.queued == 0
+
+    asyncio.run(run())
+
+
+def test_release_is_idempotent():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=2, max_queued=0, max_queue_seconds=1)
+        slot = await queue.acquire()
+        slot.release()
+        slot.release()
+        assert queue.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_rate_limiter_allows_bursts_then_rejects():
+    limiter = RateLimiter(rate=1, burst=3)
+    for _ in range(3):
+        limiter.check("client")
+    with pytest.raises(Rejected) as e:
+        limiter.check("client")
+    assert (e.value.status_code, e.value.reason) == (429, "rate_limited")
+    limiter.check("other")
+
+
+def test_rate_limiter_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=2)
+    limiter.check("client", cost=2)
+    with pytest.raises(Rejected) as e:
+        limiter.check("client")
+    assert e.value.retry_after == 1
+    now[0] += 0.5
+    limiter.check("client")
+
+
+def test_rate_limiter_caps_cost_at_burst_and_evicts_old_clients():
+    limiter = RateLimiter(rate=1, burst=5, max_clients=2)
+    limiter.check("a", cost=100)
+    limiter.check("b")
+    limiter.check("c")
+    assert limiter.stats() == {"clients": 2}
+
+
+def test_client_key_only_trusts_allow_listed_api_keys():
+    keys = frozenset({key_digest("good")})
+    assert client_key({"x-api-key": "good"}, "1.2.3.4", 0, keys) == "key:" + key_digest("good")
+    assert client_key({"authorization": "Bearer good"}, "1.2.3.4", 0, keys) == "key:" + key_digest("good")
+    assert client_key({"x-api-key": "made-up"}, "1.2.3.4", 0, keys) == "ip:1.2.3.4"
+
+
+def test_client_key_reads_forwarded_for_from_the_right():
+    headers = {"x-forwarded-for": "6.6.6.6, 10.0.0.1, 10.0.0.2"}
+    assert client_key(headers, "10.0.0.9", 0) == "ip:10.0.0.9"
+    assert client_key(headers, "10.0.0.9", 1) == "ip:10.0.0.2"
+    assert client_key(headers, "10.0.0.9", 2) == "ip:10.0.0.1"
+    assert client_key({"x-forwarded-for": "10.0.0.1"}, "10.0.0.9", 3) == "ip:10.0.0.1"
+
+
+def test_client_key_ignores_rotated_forwarded_for_prefixes():
+    keys = {client_key({"x-forwarded-for": f"{i}.0.0.1, 203.0.113.7"}, "10.0.0.9", 1) for i in range(5)}
+    assert keys == {"ip:203.0.113.7"}
+
+
+def test_retry_after_is_rounded_up_to_whole_seconds():
+    assert Rejected(503, "queue_full", 0.01).retry_after == 1
+    assert Rejected(503, "queue_full", 2.2).retry_after == 3
+
+
+def test_slot_records_hold_time():
+    async def run():
+        queue = AdmissionQueue(max_concurrent=1, max_queued=0, max_queue_seconds=1)
+        slot = await queue.acquire()
+        slot.admitted = time.perf_counter() - 2
+        slot.release()
+        assert queue.stats()["hold_seconds"] > 1.0
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+import asyncio
+
+import numpy as np
+
+import cache
+from cache import LRUCache, SemanticCache, SQLiteCache, TieredCache
+
+
+def unit(dim, i):
+    v = np.zeros(dim, dtype=np.float32)
+    v[i] = 1.0
+    return v
+
+
+def clock(monkeypatch, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2, ttl=0)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    assert lru.get("a") == "1"
+    lru.set("c", "3")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1"
+    assert lru.stats()["hits"] == 2
+
+
+def test_lru_byte_limit_and_ttl(monkeypatch):
+    now = clock(monkeypatch)
+    lru = LRUCache(max_entries=10, max_bytes=8, ttl=10)
+    lru.set("a", "1234")
+    lru.set("b", "5678")
+    lru.set("c", "9")
+    assert len(lru) == 2
+    assert lru.bytes == 5
+    now[0] += 11
+    assert lru.get("c") is None
+    assert len(lru) == 1
+
+
+def test_sqlite_cache_round_trips_and_expires(tmp_path, monkeypatch):
+    now = clock(monkeypatch)
+    disk = SQLiteCache(str(tmp_path / "cache.db"), "test", ttl=10)
+    disk.set("text", "value")
+    disk.set("vector", np.arange(3, dtype=np.float32))
+    assert disk.get("text") == "value"
+    assert np.array_equal(disk.get("vector"), np.arange(3, dtype=np.float32))
+    now[0] += 11
+    assert disk.get("text") is None
+
+
+def test_sqlite_cache_trims_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DISK_EVICT_INTERVAL", 5)
+    disk = SQLiteCache(str(tmp_path / "cache.db"), "test", max_entries=3, ttl=0)
+    for i in range(4):
+        disk.set(f"k{i}", str(i))
+    count = "SELECT COUNT(*) FROM cache WHERE ns = 'test'"
+    assert disk._conn.execute(count).fetchone()[0] == 4
+    disk.set("k4", "4")
+    assert disk._conn.execute(count).fetchone()[0] == 3
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def run():
+        writer = TieredCache("test", LRUCache(max_entries=10), path=path)
+        await writer.aset("k", "v")
+        reader = TieredCache("test", LRUCache(max_entries=10), path=path)
+        assert reader.memory.get("k", count=False) is None
+        assert await reader.aget("k") == "v"
+        assert reader.memory.get("k", count=False) == "v"
+        assert await reader.aget("missing") is None
+
+    asyncio.run(run())
+
+
+def test_semantic_cache_matches_above_threshold_per_partition():
+    sem = SemanticCache(threshold=0.9, ttl=0)
+    sem.add("english", unit(4, 0), "teeth")
+    assert sem.lookup("english", unit(4, 0) * 3) == ("teeth", 1.0)
+    assert sem.lookup("english", unit(4, 1))[0] is None
+    assert sem.lookup("arabic", unit(4, 0))[0] is None
+    assert sem.lookup("english", unit(8, 0))[0] is None
+    assert (sem.hits, sem.misses) == (1, 3)
+
+
+def test_semantic_cache_grows_from_a_small_partition(monkeypatch):
+    monkeypatch.setattr(cache, "INITIAL_PARTITION_CAPACITY", 4)
+    sem = SemanticCache(threshold=0.99, max_entries=10, ttl=0)
+    sem.add("p", unit(16, 0), 0)
+    assert len(sem._partitions["p"]["values"]) == 4
+    for i in range(1, 9):
+        sem.add("p", unit(16, i), i)
+    assert len(sem._partitions["p"]["values"]) == 10
+    assert sem.stats()["entries"] == 9
+    for i in range(9):
+        assert sem.lookup("p", unit(16, i))[0] == i
+
+
+def test_semantic_cache_overwrites_oldest_once_full(monkeypatch):
+    monkeypatch.setattr(cache, "INITIAL_PARTITION_CAPACITY", 2)
+    sem = SemanticCache(threshold=0.99, max_entries=3, ttl=0)
+    for i in range(5):
+        sem.add("p", unit(8, i), i)
+    assert sem.stats()["entries"] == 3
+    assert len(sem._partitions["p"]["values"]) == 3
+    assert [sem.lookup("p", unit(8, i))[0] for i in range(5)] == [None, None, 2, 3, 4]
+
+
+def test_semantic_cache_ignores_expired_entries(monkeypatch):
+    now = clock(monkeypatch)
+    sem = SemanticCache(threshold=0.9, ttl=10)
+    sem.add("p", unit(4, 0), "old")
+    now[0] += 5
+    sem.add("p", unit(4, 1), "new")
+    now[0] += 6
+    assert sem.lookup("p", unit(4, 0))[0] is None
+    assert sem.lookup("p", unit(4, 1))[0] == "new"
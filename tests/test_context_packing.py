@@ -0,0 +1,73 @@
+import context_packing
+from context_packing import drop_duplicates, fill_budget, join_overlapping, merge_adjacent, minhash, pack, similarity
+
+WORDS = ("brush twice a day with fluoride toothpaste and floss between the teeth every night before bed "
+         "to keep plaque from building up along the gum line where decay and gum disease usually start").split()
+
+
+def chunk(chunk_id, text, title="Care"):
+    return {"id": chunk_id, "title": title, "text": text}
+
+
+def test_minhash_estimates_shingle_similarity():
+    text = " ".join(WORDS)
+    assert similarity(minhash(text), minhash(text)) == 1.0
+    assert similarity(minhash(text), minhash(text.upper())) == 1.0
+    assert similarity(minhash(text), minhash("whitening removes surface stains from enamel over time")) < 0.2
+
+
+def test_drop_duplicates_keeps_the_most_relevant_copy():
+    text = " ".join(WORDS)
+    near = text.replace("every night", "each night")
+    chunks = [chunk("a#1", text), chunk("b#7", near), chunk("c#2", "whitening removes surface stains")]
+    assert [c["id"] for c in drop_duplicates(chunks, threshold=0.5)] == ["a#1", "c#2"]
+
+
+def test_join_overlapping_removes_the_repeated_words():
+    a = " ".join(WORDS[:20])
+    b = " ".join(WORDS[12:])
+    assert join_overlapping(a, b) == " ".join(WORDS)
+    assert join_overlapping("no shared words", "at all here") == "no shared words\nat all here"
+
+
+def test_merge_adjacent_joins_consecutive_chunks_at_the_best_rank():
+    chunks = [
+        chunk("guide#3", " ".join(WORDS[12:])),
+        chunk("other#1", "whitening removes surface stains"),
+        chunk("guide#2", " ".join(WORDS[:20])),
+        chunk("guide#9", "a far away part of the guide"),
+    ]
+    merged = merge_adjacent(chunks)
+    assert [c["id"] for c in merged] == ["guide#3", "other#1", "guide#9"]
+    assert merged[0]["text"] == " ".join(WORDS)
+    assert merged[0]["merged_ids"] == ["guide#2", "guide#3"]
+
+
+def test_merge_adjacent_ignores_ids_without_a_position():
+    chunks = [chunk("match-0", "first"), chunk("match-1", "second")]
+    assert merge_adjacent(chunks) == chunks
+
+
+def test_merge_adjacent_keeps_documents_apart():
+    chunks = [chunk("guide#1", "one"), chunk("guide#2", "two", title="Other")]
+    assert merge_adjacent(chunks) == chunks
+
+
+def test_fill_budget_truncates_only_the_first_chunk():
+    long = chunk("a#1", "word " * 400)
+    short = chunk("b#1", "short text")
+    packed = fill_budget([long, short], budget=50)
+    assert [c["id"] for c in packed] == ["a#1"]
+    assert context_packing.estimate_tokens(packed[0]["text"]) <= 50
+    assert [c["id"] for c in fill_budget([short, long], budget=50)] == ["b#1"]
+
+
+def test_pack_reports_what_it_removed():
+    text = " ".join(WORDS)
+    chunks = [chunk("a#1", text), chunk("b#4", text), chunk("c#1", "whitening removes surface stains")]
+    packed, report = pack(chunks, budget=1000)
+    assert [c["id"] for c in packed] == ["a#1", "c#1"]
+    assert report["chunks_in"] == 3
+    assert report["chunks_out"] == 2
+    assert report["duplicates"] == 1
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"] > 0
@@ -0,0 +1,67 @@
+import lexical
+from lexical import BM25Index, rerank, rrf_fuse, tokenize
+
+DOCS = {
+    "wisdom": "Wisdom teeth often need extraction when they are impacted.",
+    "floss": "Floss once a day to clean between teeth and along the gums.",
+    "bleeding": "Bleeding gums when brushing are an early sign of gum disease.",
+    "whitening": "Teeth whitening removes surface stains from enamel.",
+}
+
+
+def index():
+    return BM25Index(list(DOCS), list(DOCS.values()))
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("Why do my gums bleed?") == ["gums", "bleed"]
+
+
+def test_bm25_ranks_the_matching_document_first():
+    idx = index()
+    hits = idx.search("bleeding gums", top_k=2)
+    assert idx.ids[hits[0][0]] == "bleeding"
+    assert len(hits) == 2
+    assert hits[0][1] > hits[1][1]
+
+
+def test_bm25_rare_terms_outweigh_common_ones():
+    idx = index()
+    assert idx.idf["wisdom"] > idx.idf["teeth"]
+    assert idx.ids[idx.search("teeth wisdom", top_k=1)[0][0]] == "wisdom"
+
+
+def test_bm25_unknown_terms_find_nothing():
+    assert index().search("capital of france", top_k=3) == []
+    assert BM25Index([], []).search("teeth", top_k=3) == []
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = rrf_fuse(["a", "b", "c"], ["b", "d", "a"])
+    assert fused == ["b", "a", "d", "c"]
+
+
+def test_rrf_keeps_single_ranking_order():
+    assert rrf_fuse(["x", "y", "z"]) == ["x", "y", "z"]
+
+
+def test_rerank_scores_in_unit_range_and_applies_cutoff(monkeypatch):
+    monkeypatch.setattr(lexical, "RERANK_TOP_N", 2)
+    candidates = [
+        {"text": DOCS["floss"], "dense": 0.30, "bm25": 0.5},
+        {"text": DOCS["bleeding"], "dense": 0.65, "bm25": 4.0},
+        {"text": DOCS["whitening"], "dense": 0.10, "bm25": 0.0},
+        {"text": DOCS["wisdom"], "dense": 0.40, "bm25": 1.0},
+    ]
+    ranked = rerank("bleeding gums", candidates)
+    assert ranked[0]["text"] == DOCS["bleeding"]
+    assert len(ranked) == 2
+    assert all(0.0 <= c["rerank"] <= 1.0 for c in candidates)
+    assert candidates[2]["rerank"] < lexical.RERANK_MIN_SCORE
+    assert candidates[2] not in ranked
+
+
+def test_rerank_without_dense_scores_uses_the_remaining_features():
+    ranked = rerank("bleeding gums", [{"text": DOCS["bleeding"], "bm25": 2.0}])
+    assert ranked[0]["rerank"] == 1.0
+    assert rerank("anything", []) == []
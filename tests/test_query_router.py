@@ -0,0 +1,61 @@
+import pytest
+
+import query_router
+from query_router import is_clean_english, is_follow_up, local_translate
+
+
+@pytest.mark.parametrize("a, b", [
+    ("ليش التفريش بعد الخلع", "ليش التفريش قبل الخلع"),
+    ("ليش التفريش بعد الخلع", "كيف التفريش بعد الخلع"),
+    ("هل لازم خلع ضرس العقل", "هل ممكن خلع ضرس العقل"),
+    ("الم شديد في ضرسي", "الم في ضرسي"),
+    ("سني يوجعني مع الحار ولا البارد", "سني يوجعني مع الحار لا البارد"),
+    ("متى التفريش بعد الخلع", "التفريش بعد الخلع"),
+])
+def test_minimal_pairs_get_distinct_local_queries(a, b):
+    qa, qb = local_translate(a), local_translate(b)
+    assert qa is not None and qb is not None
+    assert qa != qb
+
+
+def test_local_translate_maps_dental_terms():
+    assert local_translate("ليش التفريش بعد الخلع") == "why brushing after extraction"
+    assert local_translate("سني يوجعني مع الحار ولا البارد") == "tooth pain hot or cold"
+    assert local_translate("علاج العصب") == "root canal treatment"
+
+
+def test_local_translate_falls_back_on_unknown_or_non_dental_words():
+    assert local_translate("ليش السماء زرقاء") is None
+    assert local_translate("هل ممكن") is None
+
+
+def test_stopwords_do_not_shadow_kept_terms():
+    assert not set(query_router.ARABIC_QUESTION_TERMS) & query_router.ARABIC_STOPWORDS
+
+
+def test_is_clean_english():
+    assert is_clean_english("Why do my gums bleed when I brush?")
+    assert not is_clean_english("why do my teath hurt")
+    assert not is_clean_english("ليش")
+
+
+@pytest.mark.parametrize("q", ["what about for kids?", "is it normal?", "and after that?", "طيب والاطفال"])
+def test_short_dependent_questions_are_follow_ups(q):
+    assert is_follow_up(q)
+
+
+@pytest.mark.parametrize("q", [
+    "is it normal for gums to bleed during pregnancy",
+    "how long does a filling last",
+    "",
+])
+def test_standalone_questions_are_not_follow_ups(q):
+    assert not is_follow_up(q)
+
+
+def test_arabic_keys_are_normalized():
+    from examples import normalize_text
+
+    for words in (query_router.ARABIC_DENTAL_TERMS, query_router.ARABIC_QUESTION_TERMS,
+                  query_router.ARABIC_STOPWORDS, query_router.ARABIC_FOLLOW_UP_OPENERS):
+        assert all(normalize_text(w) == w for w in words)
@@ -0,0 +1,134 @@
+import asyncio
+
+import httpx
+import pytest
+
+import transport
+from transport import CircuitBreaker, CircuitOpenError, RetryBudget, Upstream
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("test", failures=2, reset_seconds=0)
+    breaker.check()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+
+    # reset_seconds=0: the next check turns into the half-open probe, concurrent calls are rejected.
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.rejected == 1
+
+    breaker.success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failures=1, reset_seconds=0)
+    breaker.failure()
+    breaker.check()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+
+
+def test_open_breaker_rejects_until_reset():
+    breaker = CircuitBreaker("test", failures=1, reset_seconds=60)
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.state == "open"
+
+
+def test_released_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker("test", failures=1, reset_seconds=0)
+    breaker.failure()
+    breaker.check()
+    breaker.release()
+    breaker.check()
+    assert breaker.state == "half_open"
+
+
+class Hang(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        await asyncio.sleep(60)
+
+
+class Fail(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        raise httpx.ConnectError("refused")
+
+
+def test_cancelled_probe_does_not_wedge_the_breaker(monkeypatch):
+    monkeypatch.setattr(transport, "MAX_ATTEMPTS", 1)
+    up = Upstream("test")
+    up.breaker = CircuitBreaker("test", failures=1, reset_seconds=0)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport.AsyncUpstreamTransport(up, Fail())) as http:
+            with pytest.raises(httpx.ConnectError):
+                await http.get("http://upstream/")
+        assert up.breaker.state == "open"
+
+        async with httpx.AsyncClient(transport=transport.AsyncUpstreamTransport(up, Hang())) as http:
+            probe = asyncio.ensure_future(http.get("http://upstream/"))
+            await asyncio.sleep(0.01)
+            assert up.breaker.state == "half_open"
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+        up.breaker.check()
+
+    asyncio.run(run())
+
+
+def test_cancelled_guard_does_not_wedge_the_breaker(monkeypatch):
+    up = Upstream("test")
+    up.breaker = CircuitBreaker("test", failures=1, reset_seconds=0)
+    monkeypatch.setitem(transport.UPSTREAMS, "test", up)
+    up.breaker.failure()
+
+    async def call():
+        with transport.guard("test"):
+            await asyncio.sleep(60)
+
+    async def run():
+        task = asyncio.ensure_future(call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    up.breaker.check()
+    assert up.breaker.state == "half_open"
+
+
+def test_guard_ignores_client_errors(monkeypatch):
+    up = Upstream("test")
+    monkeypatch.setitem(transport.UPSTREAMS, "test", up)
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    with pytest.raises(BadRequest):
+        with transport.guard("test"):
+            raise BadRequest()
+    assert up.failures == 0
+    assert up.breaker.consecutive == 0
+
+
+def test_retry_budget_limits_retries_to_a_fraction_of_first_attempts():
+    budget = RetryBudget(ratio=0.5, minimum=2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    assert budget.exhausted == 1
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
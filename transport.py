@@ -0,0 +1,372 @@
+"""Shared upstream transport: pooled HTTP/2 clients, per-stage timeouts, retry budgets and circuit breakers.
+
+OpenAI calls go through ``UpstreamTransport``, which picks the timeout from the
+``metrics.stage()`` block the call runs in, retries transient failures with
+jittered backoff while the upstream's retry budget allows, and fails fast while
+that upstream's breaker is open. Pinecone manages its own HTTP client, so it
+gets the pool size, timeout and retry settings through its constructor and the
+breaker through ``guard()``.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+import httpx
+
+import metrics
+
+log = logging.getLogger("ora")
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:  # optional: connections stay on HTTP/1.1 without it
+    h2 = None
+
+POOL_MAX_CONNECTIONS = int(os.getenv("ORA_POOL_MAX_CONNECTIONS", "200"))
+POOL_MAX_KEEPALIVE = int(os.getenv("ORA_POOL_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("ORA_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("ORA_HTTP2", "1") == "1" and h2 is not None
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("ORA_CONNECT_TIMEOUT_SECONDS", "3"))
+
+# Read timeout per pipeline stage; calls outside a known stage get the default.
+STAGE_TIMEOUTS = {
+    "translate": 6.0,
+    "rewrite": 6.0,
+    "relevance": 5.0,
+    "summary": 8.0,
+    "embed": 6.0,
+    "answer": 40.0,
+    "pinecone": 4.0,
+}
+for _name in STAGE_TIMEOUTS:
+    STAGE_TIMEOUTS[_name] = float(os.getenv(f"ORA_TIMEOUT_{_name.upper()}_SECONDS", STAGE_TIMEOUTS[_name]))
+DEFAULT_TIMEOUT_SECONDS = STAGE_TIMEOUTS["answer"]
+
+# Attempts per call (first try included) and the full-jitter backoff bounds.
+MAX_ATTEMPTS = int(os.getenv("ORA_RETRY_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_CAP_SECONDS = 2.0
+# Retries may add at most this fraction on top of first attempts, so an outage
+# does not multiply load on an upstream that is already struggling.
+RETRY_BUDGET_RATIO = float(os.getenv("ORA_RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN = 10
+
+# Consecutive failures that open a breaker, and how long it stays open before a probe.
+BREAKER_FAILURES = int(os.getenv("ORA_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("ORA_BREAKER_RESET_SECONDS", "20"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def stage_timeout(stage=None) -> float:
+    return STAGE_TIMEOUTS.get(stage or metrics.current_stage(), DEFAULT_TIMEOUT_SECONDS)
+
+
+def backoff(attempt: int) -> float:
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class RetryBudget:
+    """Token bucket: every first attempt deposits ``ratio`` tokens, every retry spends one."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, minimum: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.capacity = max(minimum, 1)
+        self.tokens = float(self.capacity)
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                self.exhausted += 1
+                return False
+            self.tokens -= 1
+            self.retries += 1
+            return True
+
+
+class CircuitBreaker:
+    """closed -> open after ``failures`` consecutive errors -> half-open probe after ``reset_seconds``."""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit open")
+
+    def success(self):
+        with self._lock:
+            if self.state != "closed":
+                log.info(f"circuit closed upstream={self.name}")
+            self.state = "closed"
+            self.consecutive = 0
+            self._probing = False
+
+    def release(self):
+        """End a call that gave no verdict (cancelled); a half-open breaker lets the next call probe."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                if self.state == "closed":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+                log.warning(f"circuit open upstream={self.name} consecutive_failures={self.consecutive}")
+
+
+class Upstream:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.budget = RetryBudget()
+        self.requests = 0
+        self.failures = 0
+        self.clients = []
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "breaker_rejected": self.breaker.rejected,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.budget.retries,
+            "retry_budget_exhausted": self.budget.exhausted,
+            "retry_tokens": round(self.budget.tokens, 2),
+            # Pinecone pools its own connections, out of our view.
+            "pool": pool_stats(self.clients) if self.clients else None,
+        }
+
+
+UPSTREAMS = {name: Upstream(name) for name in ("openai", "pinecone")}
+
+
+def retryable(error: Exception = None, response: httpx.Response = None) -> bool:
+    if response is not None:
+        return response.status_code in RETRYABLE_STATUS
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status in RETRYABLE_STATUS
+
+
+def with_timeout(request: httpx.Request) -> httpx.Request:
+    read = stage_timeout()
+    request.extensions["timeout"] = {"connect": CONNECT_TIMEOUT_SECONDS, "read": read, "write": read, "pool": read}
+    return request
+
+
+class UpstreamTransport(httpx.BaseTransport):
+    def __init__(self, upstream: Upstream, inner: httpx.BaseTransport):
+        self.upstream = upstream
+        self.inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        up = self.upstream
+        up.budget.deposit()
+        with_timeout(request)
+        attempt = 0
+        while True:
+            up.breaker.check()
+            up.requests += 1
+            try:
+                response = self.inner.handle_request(request)
+            except Exception as e:
+                response, error = None, e
+            else:
+                error = None
+                if not retryable(response=response):
+                    up.breaker.success()
+                    return response
+
+            up.failures += 1
+            up.breaker.failure()
+            attempt += 1
+            if (error is not None and not retryable(error)) or attempt >= MAX_ATTEMPTS or not up.budget.withdraw():
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            log.info(f"retrying upstream={up.name} attempt={attempt + 1} reason={error or response.status_code}")
+            time.sleep(backoff(attempt))
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncUpstreamTransport(httpx.AsyncBaseTransport):
+    def __init__(self, upstream: Upstream, inner: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        up = self.upstream
+        up.budget.deposit()
+        with_timeout(request)
+        attempt = 0
+        while True:
+            up.breaker.check()
+            up.requests += 1
+            try:
+                response = await self.inner.handle_async_request(request)
+            except asyncio.CancelledError:
+                up.breaker.release()
+                raise
+            except Exception as e:
+                response, error = None, e
+            else:
+                error = None
+                if not retryable(response=response):
+                    up.breaker.success()
+                    return response
+
+            up.failures += 1
+            up.breaker.failure()
+            attempt += 1
+            if (error is not None and not retryable(error)) or attempt >= MAX_ATTEMPTS or not up.budget.withdraw():
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                await response.aclose()
+            log.info(f"retrying upstream={up.name} attempt={attempt + 1} reason={error or response.status_code}")
+            await asyncio.sleep(backoff(attempt))
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def http_client(upstream: str) -> httpx.Client:
+    up = UPSTREAMS[upstream]
+    inner = httpx.HTTPTransport(http2=HTTP2_ENABLED, limits=limits())
+    http = httpx.Client(transport=UpstreamTransport(up, inner), timeout=DEFAULT_TIMEOUT_SECONDS)
+    up.clients.append(inner)
+    return http
+
+
+def async_http_client(upstream: str) -> httpx.AsyncClient:
+    up = UPSTREAMS[upstream]
+    inner = httpx.AsyncHTTPTransport(http2=HTTP2_ENABLED, limits=limits())
+    http = httpx.AsyncClient(transport=AsyncUpstreamTransport(up, inner), timeout=DEFAULT_TIMEOUT_SECONDS)
+    up.clients.append(inner)
+    return http
+
+
+def pool_stats(transports) -> dict:
+    """Connection counts read from the httpcore pools behind ``transports``."""
+    total = idle = http2 = 0
+    for t in transports:
+        for conn in getattr(getattr(t, "_pool", None), "connections", []):
+            total += 1
+            idle += bool(conn.is_idle())
+            http2 += "HTTP/2" in repr(conn)
+    return {"connections": total, "idle": idle, "http2": http2}
+
+
+@contextmanager
+def guard(upstream: str):
+    """Breaker bookkeeping for SDK calls that do not go through ``UpstreamTransport``."""
+    up = UPSTREAMS[upstream]
+    up.breaker.check()
+    up.requests += 1
+    try:
+        yield
+    except Exception as e:
+        # Client errors (4xx other than throttling) say nothing about upstream health.
+        status = getattr(e, "status_code", None) or getattr(e, "status", None)
+        if status is None or status in RETRYABLE_STATUS or status >= 500:
+            up.failures += 1
+            up.breaker.failure()
+        raise
+    except BaseException:
+        # Cancelled mid-call: no verdict on the upstream, but the probe slot must not stay taken.
+        up.breaker.release()
+        raise
+    up.breaker.success()
+
+
+def stats() -> dict:
+    return {name: up.stats() for name, up in UPSTREAMS.items()}
+
+
+@metrics.collector
+def transport_metrics():
+    st = stats()
+    breaker_state = {"closed": 0, "half_open": 1, "open": 2}
+    return [
+        (
+            "ora_upstream_pool_connections",
+            "Pooled upstream connections by state.",
+            "gauge",
+            [
+                ({"upstream": name, "state": state}, s["pool"][key])
+                for name, s in st.items()
+                if s["pool"] is not None
+                for state, key in (("open", "connections"), ("idle", "idle"), ("http2", "http2"))
+            ],
+        ),
+        (
+            "ora_upstream_breaker_state",
+            "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open).",
+            "gauge",
+            [({"upstream": name}, breaker_state[s["breaker"]]) for name, s in st.items()],
+        ),
+        (
+            "ora_upstream_events_total",
+            "Upstream attempts, failures, retries and breaker events.",
+            "counter",
+            [
+                ({"upstream": name, "event": event}, s[event])
+                for name, s in st.items()
+                for event in ("requests", "failures", "retries", "retry_budget_exhausted", "breaker_opens", "breaker_rejected")
+            ],
+        ),
+    ]